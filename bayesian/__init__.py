@@ -1,5 +1,80 @@
-from collections import defaultdict
+from collections import defaultdict, Counter
+from array import array
+import heapq
+import itertools
 import os
+import sys
+from time import perf_counter
+import zlib
+
+# Instrumentation, see `bayesian.stats`. Hot paths only check this for None
+# when disabled.
+_stats = None
+
+# Source of model versions, unique across models, so that a new model (e.g.
+# a reloaded one) never matches the entries cached for another.
+_versions = itertools.count()
+
+# Submodules and the names they export, imported on first access so that
+# `import bayesian` doesn't pay for NumPy, process pools or asyncio.
+_LAZY_SUBMODULES = ('aio', 'benchmark', 'cache', 'compact', 'compaction', 'evaluation',
+                    'features', 'incremental', 'parallel', 'server', 'stats', 'storage',
+                    'vectorized')
+_LAZY_NAMES = {'AsyncClassifier': 'aio',
+               'CompactBayes': 'compact',
+               'Extractor': 'features',
+               'train_parallel': 'parallel'}
+
+def __getattr__(name):
+    from importlib import import_module
+    if name in _LAZY_SUBMODULES:
+        return import_module('bayesian.' + name)
+    if name in _LAZY_NAMES:
+        value = getattr(import_module('bayesian.' + _LAZY_NAMES[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_SUBMODULES) | set(_LAZY_NAMES))
+
+BACKENDS = ('auto', 'numpy', 'python')
+# Backend of the `predict_batch` methods, see `set_backend`.
+_backend = 'auto'
+
+def set_backend(name):
+    """
+    Chooses how `predict_batch` scores instances: 'numpy' for the vectorized
+    backend (ImportError if NumPy is not installed), 'python' for pure
+    Python, or 'auto' to use NumPy only if it's installed. Defaults to the
+    BAYESIAN_BACKEND environment variable, or 'auto'.
+    """
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError('Unknown backend {!r}. Backends: {}.'.format(name, BACKENDS))
+    _backend = name
+
+# Validated like any other name, so a typo fails instead of meaning 'auto'.
+set_backend(os.environ.get('BAYESIAN_BACKEND', 'auto'))
+
+def get_backend():
+    """ Returns the backend `predict_batch` uses now, 'numpy' or 'python'. """
+    return 'python' if _vectorized() is None else 'numpy'
+
+def _vectorized():
+    """
+    Returns the `bayesian.vectorized` module, importing it on first use, or
+    None if the backend is pure Python.
+    """
+    if _backend == 'python':
+        return None
+    try:
+        from bayesian import vectorized
+    except ImportError:
+        if _backend == 'numpy':
+            raise
+        return None
+    return vectorized
 
 def classify(instance, classes_instances, extractor=str.split, priors=None):
     """
@@ -8,11 +83,94 @@ def classify(instance, classes_instances, extractor=str.split, priors=None):
     into a list of events/features to be analyzed, which defaults to a simple
     word extraction.
     """
-    priors = priors or {class_: 1.0 for class_ in classes_instances}
-    model = Bayes.extract_events_odds(classes_instances, extractor)
-    b = Bayes(priors)
-    b.update_from_events(extractor(instance), model)
-    return b.most_likely()
+    return NaiveBayesClassifier(classes_instances, extractor, priors).predict(instance)
+
+def read_file(path):
+    """ Returns the contents of the file at `path`, closing it afterwards. """
+    with open(path) as f:
+        return f.read()
+
+# File marking the index directories of `bayesian.incremental`, which may be
+# inside the folders they sort and are not classes.
+INDEX_MARKER = '.bayesian-index'
+
+def list_folder(folder):
+    """
+    Returns the tuple (subfolders, files) with the paths of the items directly
+    inside `folder`. Index directories (see `classify_folder`) are skipped.
+    """
+    subfolders = []
+    files = []
+    for item in os.listdir(folder):
+        path = os.path.join(folder, item)
+        if os.path.isdir(path):
+            if not os.path.exists(os.path.join(path, INDEX_MARKER)):
+                subfolders.append(path)
+        else:
+            files.append(path)
+    return subfolders, files
+
+def imap_bounded(function, items, workers=None):
+    """
+    Lazily yields `function(item)` for each item in `items`, in order. With
+    `workers`, calls run in that many threads, with at most twice as many
+    results pending at any time, so memory use stays bounded on long streams.
+    """
+    if not workers:
+        for item in items:
+            yield function(item)
+        return
+
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def score_batch(classifier, instances, cutoff=0.0):
+    """
+    Scores `instances` with a single `classifier.predict_batch` call and
+    returns a list with the (prediction, posterior row) of each instance. If
+    the batch fails, instances are scored one at a time, and the list has
+    the exception raised by each instance that fails instead, so a bad
+    instance doesn't fail the others batched with it.
+    """
+    try:
+        return list(zip(*classifier.predict_batch(instances, cutoff)))
+    except Exception as e:
+        if len(instances) == 1:
+            return [e]
+    results = []
+    for instance in instances:
+        try:
+            predictions, posteriors = classifier.predict_batch([instance], cutoff)
+            results.append((predictions[0], posteriors[0]))
+        except Exception as e:
+            results.append(e)
+    return results
+
+def train_folders(folders, extractor=str.split, workers=None):
+    """
+    Returns a NaiveBayesClassifier trained with the contents of the files in
+    each of `folders`, using the folder paths as classes. Files are streamed
+    and read only once. `extractor` is a function to convert file contents
+    into a list of events/features, and `workers` is the number of threads
+    reading and extracting files in parallel.
+    """
+    classifier = NaiveBayesClassifier(extractor=extractor)
+    labeled_paths = ((folder, os.path.join(folder, child))
+                     for folder in folders
+                     for child in os.listdir(folder)
+                     if os.path.isfile(os.path.join(folder, child)))
+    read_events = lambda item: (item[0], classifier._extract(read_file(item[1])))
+    for folder, events in imap_bounded(read_events, labeled_paths, workers):
+        classifier._add_events(events, folder)
+    return classifier
 
 def classify_file(file_, folders, extractor=str.split):
     """
@@ -21,41 +179,48 @@ def classify_file(file_, folders, extractor=str.split):
     into a list of events/features to be analyzed, which defaults to a simple
     word extraction.
     """
-    classes_instances = defaultdict(list)
-    for folder in folders:
-        for child in os.listdir(folder):
-            child_path = os.path.join(folder, child)
-            if os.path.isfile(child_path):
-                classes_instances[folder].append(child_path)
-
-    new_extractor = lambda f: extractor(open(f).read())
-    return classify(file_, classes_instances, new_extractor)
+    return train_folders(folders, extractor).predict(read_file(file_))
 
-def classify_folder(folder, extractor=str.split):
+def classify_folder(folder, extractor=str.split, workers=None, index=None):
     """
     Move every file in `folder` into one of its subfolders, based on the
     contents of the files in those subfolders. `extractor` is a function to
     convert file contents into a list of events/features to be analyzed, which
     defaults to a simple word extraction.
+
+    The subfolders are read once to train a single model, then the files are
+    classified in a streaming pass, with `workers` threads reading and
+    extracting files in parallel. Each moved file also trains the model for
+    the following ones.
+
+    With `index`, a directory where the model and file metadata are kept
+    between calls, only files added or changed since the last call are read
+    (see `bayesian.incremental`).
     """
-    subfolders = []
-    files = []
-    for item in os.listdir(folder):
-        path = os.path.join(folder, item)
-        if os.path.isdir(path):
-            subfolders.append(path)
-        else:
-            files.append(path)
+    if index is not None:
+        from bayesian import incremental
+        return incremental.classify_folder(folder, index, extractor, workers)
+
+    subfolders, files = list_folder(folder)
+    classifier = train_folders(subfolders, extractor, workers)
+    if not classifier.labels:
+        return
 
-    for file_ in files:
-        classification = classify_file(file_, subfolders, extractor)
+    read_events = lambda file_: (file_, classifier._extract(read_file(file_)))
+    for file_, events in imap_bounded(read_events, files, workers):
+        events = list(events)
+        scores = classifier._log_scores(events)
+        classification = Bayes.from_log_odds(scores, classifier.labels).most_likely()
+        if classification is None:
+            continue
         new_path = os.path.join(classification, os.path.basename(file_))
         if not os.path.exists(new_path):
             print(file_, classification)
             os.rename(file_, new_path)
+            classifier._add_events(events, classification)
 
 
-from math import sqrt, pi, exp
+from math import sqrt, pi, exp, log
 def gaussian_distribution(values):
     """
     Given a list of values, returns the (mean, variance) tuple for a
@@ -69,12 +234,57 @@ def gaussian_distribution(values):
         variance = 0
     return (mean, variance)
 
+class RunningGaussian(object):
+    """
+    Count, mean and sum of squared deviations (`m2`) of a stream of values,
+    updated one value at a time with Welford's algorithm, so the Gaussian
+    distribution of any number of values takes constant memory and a single
+    pass.
+    """
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self, values=()):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        for value in values:
+            self.add(value)
+
+    def add(self, value):
+        """ Adds one value to the statistics. """
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other):
+        """
+        Adds the statistics of `other`, computed from different values (e.g.
+        another shard of the data). Modifies the instance and returns itself.
+        """
+        if other.count:
+            count = self.count + other.count
+            delta = other.mean - self.mean
+            self.mean += delta * other.count / count
+            self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+            self.count = count
+        return self
+
+    def distribution(self):
+        """ Returns the (mean, variance) tuple, like `gaussian_distribution`. """
+        return (self.mean, self.m2 / (self.count - 1) if self.count > 1 else 0)
+
+    def __repr__(self):
+        return 'RunningGaussian(count={}, mean={}, m2={})'.format(self.count, self.mean, self.m2)
+
 def gaussian_probability(sample, distribution):
     """
     Given a sample value and the (mean, variance) distribution,
     return the probability of this sample belonging to the
     distribution.
     """
+    if _stats is not None:
+        _stats.record('gaussian', densities=1)
     mean, variance = distribution
 
     # Special case of degenerate distribution.
@@ -89,17 +299,38 @@ def properties_distributions(classes_population):
     """
     Converts classes populations into classes distributions by property.
     {class: [{property: value}]} -> {property: {class: distribution}}
+
+    Populations are read in a single pass, so they may be iterators.
     """
-    distributions = defaultdict(dict)
+    statistics = defaultdict(dict)
     for class_, population in classes_population.items():
-        properties_instances = defaultdict(list)
         for properties in population:
             for property, value in properties.items():
-                properties_instances[property].append(value)
-        for property, instances in properties_instances.items():
-            distributions[property][class_] = gaussian_distribution(instances)
+                running = statistics[property].get(class_)
+                if running is None:
+                    running = statistics[property][class_] = RunningGaussian()
+                running.add(value)
+    distributions = defaultdict(dict)
+    for property, classes_statistics in statistics.items():
+        for class_, running in classes_statistics.items():
+            distributions[property][class_] = running.distribution()
     return distributions
 
+def csv_records(path, label_column, properties=None):
+    """
+    Lazily yields a (class, {property: value}) record for each row of the
+    CSV file at `path`, taking the class from column `label_column` and
+    converting the other columns (or only `properties`) to floats. Empty
+    cells are skipped. Meant for `GaussianClassifier.fit_records`, to train
+    on files larger than memory.
+    """
+    import csv
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            label = row.pop(label_column)
+            yield label, {property: float(value) for property, value in row.items()
+                          if value and (properties is None or property in properties)}
+
 def classify_normal(instance, classes_instances, priors=None):
     """
     Classify `instance` into one of the classes from `classes_instances`,
@@ -121,7 +352,855 @@ def classify_normal(instance, classes_instances, priors=None):
         b.update(probability_by_class)
 
     return b.most_likely()
-        
+
+class NaiveBayesClassifier(object):
+    """
+    Classifier trained once from `classes_instances` ({class: [instances]})
+    and reused for any number of predictions. Training runs `extractor` over
+    the whole corpus, while each prediction only looks up the events of the
+    instance being classified.
+
+    The model keeps the raw count of every event in every class, so it can
+    also be trained incrementally (`partial_fit`), untrained (`forget`) and
+    combined with other models (`merge`) without starting over.
+
+    Events are interned to integer ids in `vocabulary` ({event: id}), and
+    counts are stored in a flat array laid out as (vocabulary x classes), so
+    the count of event id `e` in class number `c` is
+    `counts[e * len(labels) + c]`. Counts are 32-bit, and the array is only
+    widened to 64 bits if a count ever exceeds 2**31 - 1.
+
+    Scoring reads `log_odds`, a second array with the same layout holding
+    `log(count + smoothing)`, so predictions don't compute one logarithm per
+    event and class. It costs 8 bytes per cell, for 12 in total with the
+    counts (see `memory_usage`), and is recomputed whenever `smoothing`
+    changes.
+    """
+    def __init__(self, classes_instances=None, extractor=str.split, priors=None,
+                 smoothing=0.000001):
+        """
+        Builds the events odds table from `classes_instances`, which may be
+        empty to start an online model. `extractor` is a function to convert
+        instances into a list of events/features, and `priors` ({class:
+        odds}) defaults to uniform. When `priors` is given, classes missing
+        from it are ignored. `smoothing` is the count added to every event
+        in every class, so unseen events don't zero the posterior; the
+        default matches `Bayes.extract_events_odds`.
+        """
+        classes_instances = classes_instances or {}
+        self._smoothing = smoothing
+        self.extractor = extractor
+        self.priors = dict(priors or {class_: 1.0 for class_ in classes_instances})
+        self.labels = list(sorted(self.priors.keys()))
+        self._label_index = index_labels(self.labels)
+
+        self._init_storage()
+        # Largest count in the model, used to bound log odds ratios. Not
+        # decreased by `forget`, which keeps it a valid bound.
+        self.max_count = 0
+        # Built on the first `predict_batch` call, when NumPy is available.
+        self._log_odds_matrix = None
+        # Changed by every update of the counts, see `enable_cache`.
+        self.version = next(_versions)
+        self.cache = None
+
+        for class_, instances in classes_instances.items():
+            # Classes left out of explicit priors are not trained, as in
+            # `classify`. Only `partial_fit` and `merge` add new classes.
+            if class_ not in self._label_index:
+                continue
+            for instance in instances:
+                self._add_events(self._extract(instance), class_)
+
+    def _extract(self, instance):
+        """ Runs the extractor on `instance`, timing it if stats are enabled. """
+        if _stats is None:
+            return self.extractor(instance)
+        start = perf_counter()
+        events = self.extractor(instance)
+        _stats.record('extract', perf_counter() - start, documents=1)
+        return events
+
+    def _init_storage(self):
+        """ Creates the empty vocabulary and arrays. """
+        self.vocabulary = {}
+        self.events = []
+        self.counts = array(COUNT_TYPECODE)
+        self.log_odds = array('d')
+
+    @property
+    def smoothing(self):
+        """ Count added to every event in every class. """
+        return self._smoothing
+
+    @smoothing.setter
+    def smoothing(self, smoothing):
+        self._log_odds_matrix = None
+        self.version = next(_versions)
+        self._materialize()
+        self._smoothing = smoothing
+        self.log_odds = array('d', [log(count + smoothing) for count in self.counts])
+
+    @property
+    def events_odds(self):
+        """
+        Read-only {event: [odds in label order]} view of the model, smoothed
+        like `Bayes.extract_events_odds`, to use with
+        `Bayes.update_from_events`.
+        """
+        return EventsOddsView(self)
+
+    @property
+    def events_counts(self):
+        """
+        The non-zero counts as {event: {class: count}}, for inspection.
+        """
+        n_labels = len(self.labels)
+        events_counts = {}
+        for event, index in self.vocabulary.items():
+            row = self.counts[index * n_labels:(index + 1) * n_labels]
+            counts = {label: count for label, count in zip(self.labels, row) if count}
+            if counts:
+                events_counts[event] = counts
+        return events_counts
+
+    def memory_usage(self):
+        """
+        Returns the approximate number of bytes used by the model, as a dict
+        with keys 'vocabulary' (including the events themselves), 'counts',
+        'log_odds' and 'total'.
+        """
+        if isinstance(self.vocabulary, dict):
+            vocabulary = (sys.getsizeof(self.vocabulary) + sys.getsizeof(self.events)
+                          + sum(sys.getsizeof(event) for event in self.events))
+        else:
+            # Memory-mapped (see `load`) or hashed.
+            vocabulary = self.vocabulary.nbytes
+        usage = {'vocabulary': vocabulary,
+                 'counts': self.counts.itemsize * len(self.counts),
+                 'log_odds': self.log_odds.itemsize * len(self.log_odds)}
+        usage['total'] = sum(usage.values())
+        return usage
+
+    def save(self, path):
+        """
+        Saves the trained model to `path` in a binary format that can be
+        memory-mapped by `load`. The extractor is not saved. Labels must be
+        strings or numbers, and events strings, bytes or ints.
+        """
+        from bayesian import storage
+        storage.save(self, path)
+
+    @classmethod
+    def load(cls, path, extractor=str.split, mmap=True):
+        """
+        Loads a model saved with `save`, using `extractor` for new instances.
+
+        With `mmap` the file is memory-mapped instead of read, so loading is
+        near instant and processes loading the same file share its pages. The
+        model is copied to memory only if it's trained further.
+        """
+        from bayesian import storage
+        return storage.load(path, cls(extractor=extractor), mmap)
+
+    def _materialize(self):
+        """
+        Copies a memory-mapped model into regular dicts and arrays, so it can
+        be modified.
+        """
+        if isinstance(self.counts, array):
+            return
+        self.events = list(self.events)
+        self.vocabulary = {event: i for i, event in enumerate(self.events)}
+        self.counts = array(self.counts.format, self.counts.tobytes())
+        self.log_odds = array('d', self.log_odds.tobytes())
+
+    def _add_label(self, label):
+        """
+        Adds a new class with uniform prior, moving the counts to the new
+        (vocabulary x classes) layout and recomputing the log odds.
+        """
+        self._log_odds_matrix = None
+        self.version = next(_versions)
+        self._materialize()
+        old_labels = self.labels
+        self.priors[label] = 1.0
+        self.labels = list(sorted(self.priors.keys()))
+        self._label_index = index_labels(self.labels)
+
+        n_old = len(old_labels)
+        n_new = len(self.labels)
+        counts = array(self.counts.typecode, [0]) * (len(self.events) * n_new)
+        for old_column, old_label in enumerate(old_labels):
+            new_column = self._label_index[old_label]
+            counts[new_column::n_new] = self.counts[old_column::n_old]
+        self.counts = counts
+        self.log_odds = array('d', [log(count + self.smoothing) for count in counts])
+
+    def _add_events(self, events, label, sign=1):
+        """
+        Adds (or subtracts, if `sign` is -1) one occurrence of each event in
+        `events` to the counts of class `label`.
+        """
+        self._add_counts(Counter(events), label, sign)
+
+    def _add_counts(self, events_counts, label, sign=1):
+        """
+        Adds (or subtracts, if `sign` is -1) the {event: count} mapping
+        `events_counts` to the counts of class `label`.
+        """
+        if _stats is not None:
+            start = perf_counter()
+            self._update_counts(events_counts, label, sign)
+            _stats.record('train', perf_counter() - start, trained_events=sum(events_counts.values()))
+        else:
+            self._update_counts(events_counts, label, sign)
+
+    def _update_counts(self, events_counts, label, sign):
+        """ Implementation of `_add_counts`. """
+        # Release the NumPy view of `log_odds` before resizing it.
+        self._log_odds_matrix = None
+        self.version = next(_versions)
+        self._materialize()
+        if label not in self._label_index:
+            self._add_label(label)
+        n_labels = len(self.labels)
+        column = self._label_index[label]
+        zeros = array(self.counts.typecode, [0]) * n_labels
+        unseen = array('d', [log(self.smoothing)]) * n_labels
+
+        vocabulary = self.vocabulary
+        counts = self.counts
+        log_odds = self.log_odds
+        for event, count in events_counts.items():
+            index = vocabulary.get(event)
+            if index is None:
+                index = vocabulary[event] = len(self.events)
+                self.events.append(event)
+                counts.extend(zeros)
+                log_odds.extend(unseen)
+            position = index * n_labels + column
+            total = counts[position] + sign * count
+            try:
+                counts[position] = total
+            except OverflowError:
+                counts = self._widen_counts()
+                counts[position] = total
+            log_odds[position] = log(total + self.smoothing)
+            if total > self.max_count:
+                self.max_count = total
+
+    def _widen_counts(self):
+        """ Converts `counts` to 64-bit integers and returns it. """
+        self.counts = array('q', self.counts)
+        return self.counts
+
+    def partial_fit(self, instances, labels):
+        """
+        Trains the model with more `instances`, where `labels` is the list of
+        their classes, updating only the counts of the events they contain.
+        Unseen classes are added with uniform prior.
+        """
+        for instance, label in zip(instances, labels):
+            self._add_events(self._extract(instance), label)
+        return self
+
+    def count(self, event, label):
+        """ Returns how many times `event` was seen in class `label`. """
+        index = self.vocabulary.get(event)
+        if index is None or label not in self._label_index:
+            return 0
+        return self.counts[index * len(self.labels) + self._label_index[label]]
+
+    def forget(self, instance, label):
+        """
+        Removes a previously trained `instance` of class `label` from the
+        model, as if it had never been used for training. Its events stay in
+        the vocabulary with zero counts, which don't affect predictions.
+        """
+        events = Counter(self._extract(instance))
+        for event, count in events.items():
+            if self.count(event, label) < count:
+                raise ValueError('Instance was not trained as {!r}: event {!r} missing.'.format(label, event))
+        self._add_counts(events, label, sign=-1)
+        return self
+
+    def copy(self):
+        """
+        Returns an independent copy of the model, in memory even if this one
+        is memory-mapped, that can be trained without affecting this one. The
+        prediction cache is not copied.
+        """
+        other = self.__class__.__new__(self.__class__)
+        other.__dict__.update(self.__dict__)
+        other.priors = dict(self.priors)
+        other.labels = list(self.labels)
+        other._label_index = dict(self._label_index)
+        other._log_odds_matrix = None
+        other.version = next(_versions)
+        other.cache = None
+        if not isinstance(self.counts, array):
+            # Memory-mapped, copied the same way as before training.
+            other._materialize()
+            return other
+        if isinstance(self.vocabulary, dict):
+            other.vocabulary = dict(self.vocabulary)
+            other.events = list(self.events)
+        other.counts = array(self.counts.typecode, self.counts)
+        other.log_odds = array('d', self.log_odds)
+        return other
+
+    def merge(self, other):
+        """
+        Adds the counts from `other`, another NaiveBayesClassifier trained
+        independently (e.g. on a different shard of the corpus). Modifies the
+        instance and returns itself.
+        """
+        if getattr(other, 'width', None) is not None:
+            raise TypeError('Hashed models can only be merged into hashed models.')
+        for label in other.labels:
+            if label not in self._label_index:
+                self._add_label(label)
+                self.priors[label] = other.priors[label]
+        n_labels = len(other.labels)
+        for column, label in enumerate(other.labels):
+            column_counts = other.counts[column::n_labels]
+            self._add_counts({event: count for event, count in zip(other.events, column_counts)
+                              if count}, label)
+        return self
+
+    def log_likelihoods(self, instance):
+        """
+        Returns the unnormalized log posterior of `instance` for each class,
+        in `self.labels` order. Events unknown to the model are ignored.
+        """
+        return self._log_scores(self._extract(instance))
+
+    def max_log_ratio(self):
+        """
+        Upper bound on how much a single event can change the difference
+        between the log scores of two classes.
+        """
+        return log(self.max_count + self.smoothing) - log(self.smoothing)
+
+    def _record_scoring(self, seconds, events):
+        """ Records the scoring of `events` in the enabled stats. """
+        vocabulary = self.vocabulary
+        misses = sum(1 for event in events if vocabulary.get(event) is None)
+        _stats.record('score', seconds, events=len(events), misses=misses)
+
+    def _log_scores(self, events, prune=False):
+        """
+        Adds the log odds of each event in `events` to the log priors. With
+        `prune`, classes that can no longer reach the leading class are
+        dropped as scoring goes, and get a score of -inf.
+        """
+        if _stats is None:
+            return self._score_events(events, prune)
+        events = list(events)
+        start = perf_counter()
+        scores = self._score_events(events, prune)
+        self._record_scoring(perf_counter() - start, events)
+        return scores
+
+    def _score_events(self, events, prune):
+        """
+        Implementation of `_log_scores`. Repeated events are counted first,
+        so each distinct event's log odds are added once, multiplied by its
+        count.
+        """
+        scores = Bayes(self.priors, self.labels).log_odds()
+        n_labels = len(scores)
+        log_odds = self.log_odds
+        indexes_counts = Counter(map(self.vocabulary.get, events))
+        indexes_counts.pop(None, None)
+        if not prune:
+            for index, count in indexes_counts.items():
+                start = index * n_labels
+                scores = [score + count * value for score, value
+                          in zip(scores, log_odds[start:start + n_labels])]
+            return scores
+
+        max_log_ratio = self.max_log_ratio()
+        remaining = sum(indexes_counts.values())
+        active = [i for i, score in enumerate(scores) if score != NEGATIVE_INFINITY]
+        for n, (index, count) in enumerate(indexes_counts.items()):
+            start = index * n_labels
+            if len(active) == n_labels:
+                scores = [score + count * value for score, value
+                          in zip(scores, log_odds[start:start + n_labels])]
+            else:
+                for i in active:
+                    scores[i] += count * log_odds[start + i]
+            remaining -= count
+            # Checking every few events is enough, since the bound stays
+            # valid, and keeps the cost of pruning low.
+            if n % PRUNE_INTERVAL == 0 and len(active) > 1:
+                active = prune_classes(scores, active, remaining, max_log_ratio)
+        return keep_classes(scores, active)
+
+    def beliefs(self, instance, prune=False):
+        """
+        Returns the Bayes object with the posterior odds of `instance`
+        belonging to each class. With `prune`, classes that fall too far
+        behind the leader to ever catch up are no longer scored, and end with
+        zero probability.
+        """
+        events = self._extract(instance)
+        if self.cache is not None:
+            return self._cached_beliefs(events, prune)
+        scores = self._log_scores(events, prune)
+        return Bayes.from_log_odds(scores, self.labels)
+
+    def enable_cache(self, max_entries=10000, max_bytes=None):
+        """
+        Caches the posteriors of up to `max_entries` distinct instances, and
+        about `max_bytes` bytes if given, for traffic where the same instances
+        repeat. Instances are identified by their extracted events, and
+        entries are dropped when the model is trained further. Returns the
+        `bayesian.cache.PredictionCache`, whose `stats()` count the hits,
+        misses and evictions. Set `cache` to None to disable it.
+        """
+        from bayesian.cache import PredictionCache
+        self.cache = PredictionCache(max_entries, max_bytes)
+        return self.cache
+
+    def _cached_beliefs(self, events, prune):
+        """ Same as `beliefs` for the extracted `events`, looked up in `cache` first. """
+        events = list(events)
+        key = self.cache.key(events, prune)
+        # Priors can be changed directly, without training.
+        version = (self.version, tuple(self.priors[label] for label in self.labels))
+        posterior = self.cache.get(version, key)
+        if posterior is None:
+            scores = self._log_scores(events, prune)
+            posterior = tuple(Bayes.from_log_odds(scores, self.labels))
+            self.cache.put(version, key, posterior)
+        return Bayes(posterior, self.labels)
+
+    def predict(self, instance, cutoff=0.0, prune=False):
+        """
+        Returns the class `instance` most likely belongs to, or None if its
+        probability is under `cutoff`. `prune` speeds up scoring with many
+        classes without changing the result (see `beliefs`).
+        """
+        return self.beliefs(instance, prune).most_likely(cutoff)
+
+    def top_k(self, instance, k, prune=False):
+        """
+        Returns the `k` classes `instance` most likely belongs to, as a list
+        of (class, probability) pairs, most likely first.
+        """
+        return self.beliefs(instance, prune).top_k(k)
+
+    def predict_batch(self, instances, cutoff=0.0):
+        """
+        Classifies every instance in `instances`, returning a tuple
+        (predictions, posteriors), where `posteriors` has one row per instance
+        with the class probabilities in `self.labels` order.
+
+        With the NumPy backend (see `set_backend`) the whole batch is scored
+        as a single sparse matrix product and `posteriors` is a 2D array.
+        Otherwise, or when the prediction cache is enabled (see
+        `enable_cache`), each instance is scored in pure Python and
+        `posteriors` is a list of lists.
+        """
+        vectorized = _vectorized()
+        if vectorized is None or self.cache is not None:
+            beliefs = [self.beliefs(instance) for instance in instances]
+            return ([b.most_likely(cutoff) for b in beliefs], [list(b) for b in beliefs])
+
+        if self._log_odds_matrix is None:
+            self._log_odds_matrix = vectorized.LogOddsMatrix(self.vocabulary, self.log_odds, self.labels)
+        documents_events = [self._extract(instance) for instance in instances]
+        log_priors = Bayes(self.priors, self.labels).log_odds()
+        start = perf_counter()
+        scores = self._log_odds_matrix.log_scores(documents_events, log_priors)
+        if _stats is not None:
+            self._record_scoring(perf_counter() - start,
+                                 [event for events in documents_events for event in events])
+        posteriors = vectorized.normalize_log_scores(scores)
+        return (vectorized.most_likely(self.labels, posteriors, cutoff), posteriors)
+
+class EventsOddsView(object):
+    """
+    Read-only mapping from events to the list of their odds in each class of
+    a NaiveBayesClassifier, in label order.
+    """
+    def __init__(self, classifier):
+        self.classifier = classifier
+
+    def __contains__(self, event):
+        return self.classifier.vocabulary.get(event) is not None
+
+    def __getitem__(self, event):
+        index = self.classifier.vocabulary.get(event)
+        if index is None:
+            raise KeyError(event)
+        n_labels = len(self.classifier.labels)
+        row = self.classifier.counts[index * n_labels:(index + 1) * n_labels]
+        return [count + self.classifier.smoothing for count in row]
+
+    def __len__(self):
+        return len(self.classifier.vocabulary)
+
+class HashedVocabulary(object):
+    """
+    Vocabulary of a HashedNaiveBayesClassifier, mapping every possible event
+    to one of `width` buckets with a hash that is the same in every process.
+    """
+    def __init__(self, width):
+        self.width = width
+        self.nbytes = sys.getsizeof(self)
+
+    def get(self, event, default=None):
+        if isinstance(event, int):
+            return event % self.width
+        if isinstance(event, str):
+            event = event.encode('utf-8', 'surrogatepass')
+        return zlib.crc32(event) % self.width
+
+    def __contains__(self, event):
+        return True
+
+    def __len__(self):
+        return self.width
+
+    def __iter__(self):
+        return iter(range(self.width))
+
+    def items(self):
+        return zip(range(self.width), range(self.width))
+
+class HashedNaiveBayesClassifier(NaiveBayesClassifier):
+    """
+    NaiveBayesClassifier that hashes events into a fixed number of buckets
+    instead of keeping a vocabulary, so its memory use depends only on
+    `width` and the number of classes, not on how many distinct events it
+    sees. Events that share a bucket share their counts; see
+    `collision_stats`.
+
+    `events`, `vocabulary` and `events_counts` are indexed by bucket instead
+    of by event.
+    """
+    def __init__(self, classes_instances=None, extractor=str.split, priors=None, width=2 ** 18,
+                 smoothing=0.000001):
+        """
+        Same as NaiveBayesClassifier, with `width` buckets per class.
+        """
+        self.width = width
+        super(HashedNaiveBayesClassifier, self).__init__(classes_instances, extractor, priors,
+                                                         smoothing)
+
+    def _init_storage(self):
+        """ Creates the vocabulary and the arrays with all buckets. """
+        self.vocabulary = HashedVocabulary(self.width)
+        self.events = range(self.width)
+        size = self.width * len(self.labels)
+        self.counts = array(COUNT_TYPECODE, [0]) * size
+        self.log_odds = array('d', [log(self.smoothing)]) * size
+
+    def _materialize(self):
+        """ Copies memory-mapped arrays into regular arrays. """
+        if not isinstance(self.counts, array):
+            self.counts = array(self.counts.format, self.counts.tobytes())
+            self.log_odds = array('d', self.log_odds.tobytes())
+
+    def merge(self, other):
+        """
+        Adds the counts from `other`, another HashedNaiveBayesClassifier with
+        the same `width`, bucket by bucket. Modifies the instance and returns
+        itself.
+        """
+        if not isinstance(other, HashedNaiveBayesClassifier):
+            raise TypeError('Only hashed models can be merged into hashed models.')
+        if other.width != self.width:
+            raise ValueError('Cannot merge a model of width {} into one of width {}.'.format(
+                other.width, self.width))
+        for label in other.labels:
+            if label not in self._label_index:
+                self._add_label(label)
+                self.priors[label] = other.priors[label]
+        self._log_odds_matrix = None
+        self.version = next(_versions)
+        self._materialize()
+        n_labels = len(self.labels)
+        n_other = len(other.labels)
+        counts = self.counts
+        log_odds = self.log_odds
+        for other_column, label in enumerate(other.labels):
+            column = self._label_index[label]
+            for bucket, count in enumerate(other.counts[other_column::n_other]):
+                if count:
+                    position = bucket * n_labels + column
+                    total = counts[position] + count
+                    try:
+                        counts[position] = total
+                    except OverflowError:
+                        counts = self._widen_counts()
+                        counts[position] = total
+                    log_odds[position] = log(total + self.smoothing)
+                    if total > self.max_count:
+                        self.max_count = total
+        return self
+
+    def collision_stats(self):
+        """
+        Returns a dict with the number of 'occupied' buckets (with any
+        count), the 'load_factor' (occupied / width), the number of distinct
+        events seen, 'estimated_events', and the 'collision_rate', the
+        estimated fraction of those events that share a bucket with an
+        earlier one. Estimates use linear counting, so they are None once
+        every bucket is occupied.
+        """
+        n_labels = len(self.labels)
+        counts = self.counts
+        occupied = sum(1 for bucket in range(self.width)
+                       if any(counts[bucket * n_labels:(bucket + 1) * n_labels]))
+        load_factor = occupied / float(self.width)
+        if occupied == self.width:
+            estimated_events = None
+            collision_rate = None
+        else:
+            estimated_events = -self.width * log(1 - load_factor)
+            collision_rate = 1 - occupied / estimated_events if occupied else 0.0
+        return {'width': self.width,
+                'occupied': occupied,
+                'load_factor': load_factor,
+                'estimated_events': estimated_events,
+                'collision_rate': collision_rate}
+
+class GaussianClassifier(object):
+    """
+    Gaussian naive Bayes classifier trained from `classes_instances`
+    ({class: [{property: value}]}), storing the mean and variance of every
+    property for every class. Unlike `classify_normal`, variances are floored
+    to a small positive value, so degenerate distributions (e.g. single
+    instances) penalize distant samples instead of zeroing the posterior.
+
+    Training keeps only a `RunningGaussian` per class and property in
+    `statistics` ({class: {property: RunningGaussian}}), so the model can be
+    trained further from a stream of records (`fit_records`, `partial_fit`)
+    in constant memory, and models trained on different shards can be
+    combined (`merge`).
+    """
+    def __init__(self, classes_instances=None, priors=None, var_smoothing=1e-9):
+        """
+        Computes the distributions from `classes_instances`, which may be
+        empty to train later. `priors` ({class: odds}) defaults to uniform;
+        when given, classes missing from it are ignored. The variance floor
+        is `var_smoothing` times the largest variance seen in training.
+        """
+        classes_instances = classes_instances or {}
+        self.priors = dict(priors or {class_: 1.0 for class_ in classes_instances})
+        self.var_smoothing = var_smoothing
+        self.statistics = {}
+        self.properties = []
+        self.property_index = {}
+        self.cache = None
+        # Like NaiveBayesClassifier, only `fit_records`, `partial_fit` and
+        # `merge` add new classes.
+        self._add_records((class_, instance)
+                          for class_, instances in classes_instances.items()
+                          if class_ in self.priors
+                          for instance in instances)
+        self._fit()
+
+    def _add_records(self, records):
+        """ Adds the values of (class, {property: value}) `records` to the statistics. """
+        for class_, instance in records:
+            classes_statistics = self.statistics.get(class_)
+            if classes_statistics is None:
+                classes_statistics = self.statistics[class_] = {}
+                self.priors.setdefault(class_, 1.0)
+            for property, value in instance.items():
+                running = classes_statistics.get(property)
+                if running is None:
+                    running = classes_statistics[property] = RunningGaussian()
+                    if property not in self.property_index:
+                        self.property_index[property] = len(self.properties)
+                        self.properties.append(property)
+                running.add(value)
+
+    def _fit(self):
+        """ Computes the means and floored variances from the statistics. """
+        self.version = next(_versions)
+        self.labels = list(sorted(self.priors.keys()))
+        largest = max([running.distribution()[1]
+                       for classes_statistics in self.statistics.values()
+                       for running in classes_statistics.values()] or [0])
+        floor = self.var_smoothing * largest if largest > 0 else self.var_smoothing
+
+        # means[c][p] and variances[c][p] are None when class `c` has no
+        # values for property `p`, which then doesn't affect that class.
+        self.means = []
+        self.variances = []
+        for label in self.labels:
+            classes_statistics = self.statistics.get(label, {})
+            means = []
+            variances = []
+            for property in self.properties:
+                if property in classes_statistics:
+                    mean, variance = classes_statistics[property].distribution()
+                    means.append(mean)
+                    variances.append(max(variance, floor))
+                else:
+                    means.append(None)
+                    variances.append(None)
+            self.means.append(means)
+            self.variances.append(variances)
+        # Built on the first `predict_batch` call, when NumPy is available.
+        self._gaussian_matrices = None
+
+    def fit_records(self, records):
+        """
+        Trains the model with an iterable of (class, {property: value})
+        `records`, e.g. `csv_records(path, 'class')`, reading each record
+        once and keeping none of them. Unseen classes are added with uniform
+        prior. Returns itself.
+        """
+        self._add_records(records)
+        self._fit()
+        return self
+
+    def partial_fit(self, instances, labels):
+        """
+        Trains the model with more `instances` ({property: value}), where
+        `labels` is the list of their classes. Returns itself.
+        """
+        return self.fit_records(zip(labels, instances))
+
+    def merge(self, other):
+        """
+        Adds the statistics from `other`, another GaussianClassifier trained
+        independently (e.g. on a different shard of the data). Modifies the
+        instance and returns itself.
+        """
+        for class_, other_statistics in other.statistics.items():
+            classes_statistics = self.statistics.setdefault(class_, {})
+            for property, other_running in other_statistics.items():
+                if property not in self.property_index:
+                    self.property_index[property] = len(self.properties)
+                    self.properties.append(property)
+                classes_statistics.setdefault(property, RunningGaussian()).merge(other_running)
+        for class_, odds in other.priors.items():
+            self.priors.setdefault(class_, odds)
+        self._fit()
+        return self
+
+    def log_likelihoods(self, instance):
+        """
+        Returns the unnormalized log posterior of `instance` ({property:
+        value}) for each class, in `self.labels` order. Properties unknown to
+        the model are ignored.
+        """
+        if _stats is not None:
+            start = perf_counter()
+        scores = Bayes(self.priors, self.labels).log_odds()
+        for property, value in instance.items():
+            p = self.property_index.get(property)
+            if p is None:
+                continue
+            for c in range(len(self.labels)):
+                mean = self.means[c][p]
+                if mean is not None:
+                    variance = self.variances[c][p]
+                    scores[c] -= 0.5 * (log(2 * pi * variance) + (value - mean) ** 2 / variance)
+        if _stats is not None:
+            _stats.record('gaussian', perf_counter() - start, documents=1,
+                          densities=len(instance) * len(self.labels))
+        return scores
+
+    def beliefs(self, instance):
+        """
+        Returns the Bayes object with the posterior odds of `instance`
+        belonging to each class.
+        """
+        if self.cache is None:
+            return Bayes.from_log_odds(self.log_likelihoods(instance), self.labels)
+        key = self.cache.key(instance)
+        version = (self.version, tuple(self.priors[label] for label in self.labels))
+        posterior = self.cache.get(version, key)
+        if posterior is None:
+            posterior = tuple(Bayes.from_log_odds(self.log_likelihoods(instance), self.labels))
+            self.cache.put(version, key, posterior)
+        return Bayes(posterior, self.labels)
+
+    def enable_cache(self, max_entries=10000, max_bytes=None):
+        """
+        Caches the posteriors of repeated instances, like
+        `NaiveBayesClassifier.enable_cache`. Returns the cache.
+        """
+        from bayesian.cache import PredictionCache
+        self.cache = PredictionCache(max_entries, max_bytes)
+        return self.cache
+
+    def predict(self, instance, cutoff=0.0):
+        """
+        Returns the class `instance` most likely belongs to, or None if its
+        probability is under `cutoff`.
+        """
+        return self.beliefs(instance).most_likely(cutoff)
+
+    def predict_batch(self, instances, cutoff=0.0):
+        """
+        Classifies every instance in `instances`, returning a tuple
+        (predictions, posteriors) like `NaiveBayesClassifier.predict_batch`.
+
+        `instances` is either a list of {property: value} dicts or, with the
+        NumPy backend, a 2D array of feature vectors with columns in
+        `self.properties` order (NaN for missing values), scored with matrix
+        products instead of per-property Python calls. Lists of dicts are
+        scored one by one when the prediction cache is enabled.
+        """
+        vectorized = _vectorized()
+        if vectorized is None or (self.cache is not None and not hasattr(instances, 'shape')):
+            beliefs = [self.beliefs(instance) for instance in instances]
+            return ([b.most_likely(cutoff) for b in beliefs], [list(b) for b in beliefs])
+
+        if self._gaussian_matrices is None:
+            self._gaussian_matrices = vectorized.GaussianMatrices(self.means, self.variances)
+        if not hasattr(instances, 'shape'):
+            instances = vectorized.feature_matrix(instances, self.property_index)
+        log_priors = Bayes(self.priors, self.labels).log_odds()
+        start = perf_counter()
+        scores = self._gaussian_matrices.log_scores(instances, log_priors)
+        if _stats is not None:
+            _stats.record('gaussian', perf_counter() - start, documents=len(instances),
+                          densities=instances.size * len(self.labels))
+        posteriors = vectorized.normalize_log_scores(scores)
+        return (vectorized.most_likely(self.labels, posteriors, cutoff), posteriors)
+
+# Type of the `NaiveBayesClassifier.counts` array, 32-bit integers.
+COUNT_TYPECODE = 'i'
+NEGATIVE_INFINITY = float('-inf')
+# Number of events between checks for classes to prune.
+PRUNE_INTERVAL = 8
+
+def prune_classes(scores, active, remaining, max_log_ratio):
+    """
+    Returns the indexes in `active` whose score can still reach the leading
+    score, given `remaining` events that can each change the difference
+    between two scores by at most `max_log_ratio`.
+    """
+    threshold = max(scores[i] for i in active) - remaining * max_log_ratio
+    return [i for i in active if scores[i] >= threshold]
+
+def keep_classes(scores, active):
+    """ Returns `scores` with -inf for every index not in `active`. """
+    active = set(active)
+    return [score if i in active else NEGATIVE_INFINITY for i, score in enumerate(scores)]
+
+def index_labels(labels):
+    """
+    Returns the {label: index} dictionary for the list `labels`, raising
+    ValueError if there are duplicates.
+    """
+    label_index = {label: i for i, label in enumerate(labels)}
+    if len(label_index) != len(labels):
+        raise ValueError('Labels must not be duplicated. Got {}.'.format(labels))
+    return label_index
+
 class Bayes(list):
     """
     Class for Bayesian probabilistic evaluation through creation and update of
@@ -139,11 +1218,25 @@ class Bayes(list):
         """
         small = 0.000001
         events_odds = defaultdict(lambda: defaultdict(lambda: small))
+        if _stats is not None:
+            start = perf_counter()
+            documents = sum(len(instances) for instances in classes_instances.values())
+            extract_seconds = 0.0
         for class_, instances in classes_instances.items():
             for instance in instances:
-                for event in event_extractor(instance):
+                if _stats is None:
+                    events = event_extractor(instance)
+                else:
+                    # Timed apart from counting, including lazy extractors.
+                    extract_start = perf_counter()
+                    events = list(event_extractor(instance))
+                    extract_seconds += perf_counter() - extract_start
+                for event in events:
                     events_odds[event][class_] += 1
 
+        if _stats is not None:
+            _stats.record('extract', extract_seconds, documents=documents)
+            _stats.record('count', perf_counter() - start - extract_seconds, documents=documents)
         return events_odds
 
     def __init__(self, value=None, labels=None):
@@ -175,25 +1268,38 @@ class Bayes(list):
                     labels = [str(i) for i in range(len(value))]
                 raw_values = value
 
-        if len(labels) != len(set(labels)):
-            raise ValueError('Labels must not be duplicated. Got {}.'.format(labels))
-
         self.labels = labels
         super(Bayes, self).__init__(raw_values)
 
+    @property
+    def labels(self):
+        """ Names of the odds, in order. """
+        return self._labels
+
+    @labels.setter
+    def labels(self, labels):
+        label_index = index_labels(labels)
+        self._labels = labels
+        self._label_index = label_index
+
+    def _index(self, label):
+        """ Returns the index of `label`, raising ValueError if missing. """
+        try:
+            return self._label_index[label]
+        except KeyError:
+            raise ValueError('{!r} is not a label. Labels: {}.'.format(label, self.labels))
+
     def __getitem__(self, i):
         """ Returns the odds at index or label `i`. """
         if isinstance(i, str):
-            return self[self.labels.index(i)]
-        else:
-            return super(Bayes, self).__getitem__(i)
+            i = self._index(i)
+        return super(Bayes, self).__getitem__(i)
 
     def __setitem__(self, i, value):
         """ Sets the odds at index or label `i`. """
         if isinstance(i, str):
-            self[self.labels.index(i)] = value
-        else:
-            super(Bayes, self).__setitem__(i, value)
+            i = self._index(i)
+        super(Bayes, self).__setitem__(i, value)
 
     def _cast(self, other):
         """
@@ -202,9 +1308,37 @@ class Bayes(list):
         """
         if isinstance(other, Bayes):
             return other
-        else:
+        elif isinstance(other, dict):
             return Bayes(other, self.labels)
 
+        values = list(other)
+        if len(values) and isinstance(values[0], tuple):
+            # List of (label, odds) tuples, with its own labels.
+            return Bayes(values, self.labels)
+        return self._with_values(values)
+
+    def _odds(self, other):
+        """
+        Returns `other` as odds in label order for the in-place operators.
+        Lists and tuples of odds are returned as they are, without copying.
+        """
+        if isinstance(other, dict) or not isinstance(other, (list, tuple)):
+            return self._cast(other)
+        if len(other) and isinstance(other[0], tuple):
+            return self._cast(other)
+        return other
+
+    def _with_values(self, values):
+        """
+        Creates a Bayes object with the list `values` and the same labels as
+        this instance, skipping the validation done by `__init__`.
+        """
+        new = Bayes.__new__(Bayes)
+        list.__init__(new, values)
+        new._labels = self._labels
+        new._label_index = self._label_index
+        return new
+
     def opposite(self):
         """
         Returns the opposite probabilities.
@@ -215,6 +1349,27 @@ class Bayes(list):
         else:
             return self._cast(1 / i for i in self)
 
+    def log_odds(self):
+        """
+        Returns the natural logarithm of each odd, using -inf for zeros.
+        Ex: [1, 0] -> [0.0, -inf]
+        """
+        return [log(i) if i > 0 else NEGATIVE_INFINITY for i in self]
+
+    @staticmethod
+    def from_log_odds(log_odds, labels=None):
+        """
+        Creates a normalized Bayes object from a list of natural logarithms of
+        odds, such as the ones returned by `log_odds`.
+        Ex: [log(9), log(1)] -> [.9, .1]
+        """
+        top = max(log_odds) if log_odds else NEGATIVE_INFINITY
+        if top == NEGATIVE_INFINITY:
+            # Every class is impossible, same as normalizing all zeros.
+            return Bayes([0.0 for i in log_odds], labels)
+        # Shift by the maximum before exponentiating to avoid underflow.
+        return Bayes([exp(i - top) for i in log_odds], labels).normalized()
+
     def normalized(self):
         """
         Converts the list of odds into a list probabilities that sum to 1.
@@ -225,6 +1380,17 @@ class Bayes(list):
         else:
             return self._cast(i / total for i in self)
 
+    def normalize_(self):
+        """
+        Same as `normalized`, but modifies the instance and returns itself.
+        """
+        total = float(sum(self))
+        if total == 0:
+            self[:] = [0 for i in self]
+        else:
+            self[:] = [i / total for i in self]
+        return self
+
     def __mul__(self, other):
         """
         Creates a new instance with odds from both this and the other instance.
@@ -240,36 +1406,139 @@ class Bayes(list):
         """
         return self * self._cast(other).opposite()
 
-    def update(self, event):
+    def __imul__(self, other):
+        """
+        Same as `__mul__`, but modifies the instance instead of creating a new
+        one.
+        """
+        self[:] = [i * j for i, j in zip(self, self._odds(other))]
+        return self
+
+    def __itruediv__(self, other):
+        """
+        Same as `__truediv__`, but modifies the instance instead of creating a
+        new one.
+        """
+        self[:] = [i / j if j != 0 else 0 for i, j in zip(self, self._odds(other))]
+        return self
+
+    def update(self, event, normalize=True):
         """
         Updates all current odds based on the likelihood of odds in event.
-        Modifies the instance and returns itself.
+        Modifies the instance and returns itself. With `normalize` False the
+        odds are left unnormalized, so several updates can be chained with a
+        single `normalize_` at the end.
         Ex: [.5, .5].update([.9, .1]) becomes [.45, .05] (non normalized)
         """
-        self[:] = (self * self._cast(event)).normalized()
+        if _stats is not None:
+            start = perf_counter()
+        self *= event
+        if normalize:
+            self.normalize_()
+        if _stats is not None:
+            _stats.record('update', perf_counter() - start, updates=1)
         return self
 
-    def update_from_events(self, events, events_odds):
+    def update_from_events(self, events, events_odds, log_space=False, max_log_ratio=None,
+                           aggregate=False):
         """
         Perform an update for every event in events, taking the new odds from
         the dictionary events_odds (if available).
         Ex: [.5, .5].update_from_events(['pos'], {'pos': [.9, .1]})
         becomes [.45, .05] (non normalized)
+
+        If `log_space` is True the updates are accumulated as log-likelihoods
+        and normalized only once at the end, optionally pruning labels with
+        `max_log_ratio` (see `update_from_log_events`). `aggregate` implies
+        `log_space`, and counts repeated events so each distinct event is
+        applied once, raised to its count.
         """
+        if _stats is not None:
+            events = list(events)
+            _stats.record('lookup', events=len(events),
+                          misses=sum(1 for event in events if event not in events_odds))
+        if log_space or max_log_ratio is not None or aggregate:
+            events = [event for event in events if event in events_odds]
+            events_log_odds = {event: self._cast(events_odds[event]).log_odds()
+                               for event in set(events)}
+            return self.update_from_log_events(events, events_log_odds, max_log_ratio, aggregate)
+
         for event in events:
             if event in events_odds:
                 self.update(events_odds[event])
         return self
 
-    def update_from_tests(self, tests_results, odds):
+    def update_from_log_events(self, events, events_log_odds, max_log_ratio=None, aggregate=False):
+        """
+        Same as `update_from_events`, but `events_log_odds` maps each event to
+        the natural logarithm of its odds, as a list in the same order as
+        `self.labels`. The log-likelihoods are summed and normalized only once
+        at the end, which is faster and doesn't underflow to all zeros on long
+        inputs.
+        Ex: [.5, .5].update_from_log_events(['pos'], {'pos': [log(.9), log(.1)]})
+        becomes [.9, .1]
+
+        `max_log_ratio`, if given, is an upper bound on how much a single
+        event can change the difference between the log odds of two labels.
+        It's used to stop scoring labels that fall so far behind the leader
+        that they can't catch up with the remaining events, which end with
+        zero probability. The most likely label is not affected.
+
+        With `aggregate`, repeated events are counted first and the log odds
+        of each distinct event are added once, multiplied by its count, which
+        is much faster for repetitive inputs like logs.
+        """
+        if aggregate:
+            events_counts = list(Counter(event for event in events
+                                         if event in events_log_odds).items())
+        else:
+            events_counts = [(event, 1) for event in events if event in events_log_odds]
+        scores = self.log_odds()
+        if max_log_ratio is None:
+            for event, count in events_counts:
+                for i, value in enumerate(events_log_odds[event]):
+                    scores[i] += count * value
+        else:
+            remaining = sum(count for event, count in events_counts)
+            active = [i for i, score in enumerate(scores) if score != NEGATIVE_INFINITY]
+            for n, (event, count) in enumerate(events_counts):
+                log_odds = events_log_odds[event]
+                for i in active:
+                    scores[i] += count * log_odds[i]
+                remaining -= count
+                if n % PRUNE_INTERVAL == 0 and len(active) > 1:
+                    active = prune_classes(scores, active, remaining, max_log_ratio)
+            scores = keep_classes(scores, active)
+        self[:] = Bayes.from_log_odds(scores, self.labels)
+        return self
+
+    def update_from_tests(self, tests_results, odds, aggregate=False):
         """
         For every binary test in `tests_results`, updates the current belief
         depending on `odds`. If the test was True, use the odds as-is. If the
         test was false, use the opposite odds.
         Ex: [.5, .5].update_from_tests([True], [.9, .1]) becomes [.45, .05]
         (non normalized)
+
+        With `aggregate`, only the number of True and False results is
+        counted, and each kind of update is applied once in log space, raised
+        to its count.
         """
         opposite_odds = self._cast(odds).opposite()
+        if aggregate:
+            tests_results = list(tests_results)
+            if not tests_results:
+                return self
+            n_true = sum(1 for result in tests_results if result)
+            n_false = len(tests_results) - n_true
+            scores = self.log_odds()
+            for count, log_odds in ((n_true, self._cast(odds).log_odds()),
+                                    (n_false, opposite_odds.log_odds())):
+                if count:
+                    scores = [score + count * value for score, value in zip(scores, log_odds)]
+            self[:] = Bayes.from_log_odds(scores, self.labels)
+            return self
+
         for result in tests_results:
             if result:
                 self.update(odds)
@@ -284,14 +1553,27 @@ class Bayes(list):
         Ex: {a: .4, b: .6}.most_likely() -> b
             {a: .4, b: .6}.most_likely(cutoff=.7) -> None
         """
-        normalized = self.normalized()
-        max_value = max(normalized)
+        # Same as taking the maximum of `normalized()`, without creating it.
+        i = max(range(len(self)), key=super(Bayes, self).__getitem__)
+        total = float(sum(self))
+        max_value = self[i] / total if total else 0
 
         if max_value > cutoff:
-            return self.labels[normalized.index(max_value)]
+            return self.labels[i]
         else:
             return None
 
+    def top_k(self, k):
+        """
+        Returns the `k` labels with most probability, as a list of (label,
+        probability) tuples, most likely first. Uses a heap instead of sorting
+        every label.
+        Ex: {a: .2, b: .5, c: .3}.top_k(2) -> [(b, .5), (c, .3)]
+        """
+        indexes = heapq.nlargest(k, range(len(self)), key=super(Bayes, self).__getitem__)
+        total = float(sum(self))
+        return [(self.labels[i], self[i] / total if total else 0) for i in indexes]
+
     def is_likely(self, label, minimum_probability=0.5):
         """
         Returns if `label` has at least probability `minimum_probability`.
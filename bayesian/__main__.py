@@ -0,0 +1,48 @@
+"""
+Command line interface:
+
+    python -m bayesian [--index path [--watch seconds]] folder [folder ...]
+        Moves the files in each folder into its subfolders, see
+        `bayesian.classify_folder`. With `--index`, only changes since the
+        last run are read, and `--watch` repeats every few seconds (see
+        `bayesian.incremental`).
+
+    python -m bayesian serve --model path [options]
+        Serves a saved model over HTTP or stdin, see `bayesian.server`.
+"""
+import argparse
+import os
+import sys
+import time
+
+from bayesian import classify_folder
+
+def main(arguments=None):
+    arguments = sys.argv[1:] if arguments is None else arguments
+    if arguments[:1] == ['serve']:
+        from bayesian import server
+        return server.main(arguments[1:])
+
+    parser = argparse.ArgumentParser(prog='python -m bayesian',
+                                     description='Moves the files in each folder into the '
+                                                 'subfolder with the most similar files.')
+    parser.add_argument('folders', nargs='*')
+    parser.add_argument('--index', help='directory keeping the model between runs, one '
+                                        'per folder: folder/index if relative (never '
+                                        'treated as a class, even without --index)')
+    parser.add_argument('--watch', type=float, metavar='SECONDS',
+                        help='with --index, classify again every SECONDS')
+    args = parser.parse_args(arguments)
+    if args.watch is not None and args.index is None:
+        parser.error('--watch requires --index')
+
+    while True:
+        for folder in args.folders:
+            index = os.path.join(folder, args.index) if args.index is not None else None
+            classify_folder(folder, index=index)
+        if args.watch is None:
+            break
+        time.sleep(args.watch)
+
+if __name__ == '__main__':
+    main()
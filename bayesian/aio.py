@@ -0,0 +1,126 @@
+"""
+Asyncio facade for classifying from an event loop without blocking it:
+
+    service = AsyncClassifier(NaiveBayesClassifier(classes_instances), workers=4)
+    label = await service.classify(message)
+
+Extraction and scoring run in a bounded thread pool, and requests arriving
+within `max_delay` seconds of each other are scored together with a single
+`predict_batch` call, which is much faster per instance than separate
+predictions. Files are read in the same pool.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import bayesian
+from bayesian import Bayes, score_batch
+
+async def read_file(path, executor=None):
+    """ Returns the contents of the file at `path`, read in `executor`. """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, bayesian.read_file, path)
+
+class AsyncClassifier(object):
+    """
+    Wraps a trained classifier (anything with `labels` and `predict_batch`,
+    like `NaiveBayesClassifier` or `GaussianClassifier`) for use from
+    coroutines. The classifier must not be trained while requests are
+    pending.
+    """
+    def __init__(self, classifier, workers=None, max_batch=64, max_delay=0.001, executor=None):
+        """
+        `workers` is the number of threads scoring batches, unless an
+        `executor` is given. A batch is scored when it reaches `max_batch`
+        instances, or `max_delay` seconds after its first request.
+        """
+        self.classifier = classifier
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._owns_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(workers)
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+        self.batches = 0
+
+    def _flush(self):
+        """ Starts scoring the pending requests as one batch. """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._score(batch))
+            # The loop only keeps weak references to tasks.
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _score(self, batch):
+        """
+        Scores `batch`, a list of (instance, future), in the executor. Only
+        the requests whose instance fails get the exception, see
+        `bayesian.score_batch`.
+        """
+        self.batches += 1
+        instances = [instance for instance, future in batch]
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, score_batch,
+                                                  self.classifier, instances)
+        except Exception as e:
+            # The executor itself failed, e.g. after being shut down.
+            results = [e] * len(batch)
+        for (instance, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(Bayes(list(result[1]), self.classifier.labels))
+
+    async def beliefs(self, instance):
+        """
+        Returns the Bayes distribution of `instance` over the classes,
+        scored in the next batch.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((instance, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+        return await future
+
+    async def classify(self, instance, cutoff=0.0):
+        """
+        Returns the most likely class of `instance`, or None if its
+        probability is under `cutoff`.
+        """
+        return (await self.beliefs(instance)).most_likely(cutoff)
+
+    async def classify_file(self, path, cutoff=0.0):
+        """ Reads the file at `path` without blocking and classifies its contents. """
+        return await self.classify(await read_file(path, self.executor), cutoff)
+
+    async def classify_folder(self, folder, extractor=str.split, workers=None):
+        """ Runs `bayesian.classify_folder` in the executor. """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, bayesian.classify_folder,
+                                          folder, extractor, workers)
+
+    async def close(self):
+        """
+        Scores the pending requests, waits for them, and shuts down the
+        executor if it was created by this instance.
+        """
+        self._flush()
+        if self._tasks:
+            await asyncio.wait(list(self._tasks))
+        if self._owns_executor:
+            self.executor.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -0,0 +1,221 @@
+"""
+Benchmarks for training, single prediction latency and batch throughput, over
+synthetic corpora. Results are printed as JSON, so runs can be compared across
+versions:
+
+    python -m bayesian.benchmark --vocabulary 5000 --length 200 --classes 4 > before.json
+
+Each benchmark reports the number of operations, throughput (operations per
+second), p50/p99 latency in seconds for operations timed individually, and the
+peak memory allocated while it ran.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import bayesian
+from bayesian import Bayes, NaiveBayesClassifier, classify, classify_normal
+
+def synthetic_corpus(vocabulary_size, document_length, n_classes, n_documents, seed=0):
+    """
+    Returns {class: [documents]} with `n_documents` documents per class. Each
+    class prefers its own slice of the vocabulary, so documents are
+    classifiable but share most of their words.
+    """
+    rng = random.Random(seed)
+    words = ['w{}'.format(i) for i in range(vocabulary_size)]
+    corpus = {}
+    for c in range(n_classes):
+        preferred = words[c::n_classes]
+        corpus['class{}'.format(c)] = [
+            ' '.join(rng.choice(preferred if rng.random() < 0.3 else words)
+                     for i in range(document_length))
+            for j in range(n_documents)]
+    return corpus
+
+def synthetic_measures(n_properties, n_classes, n_instances, seed=0):
+    """
+    Returns {class: [{property: value}]} with normally distributed values
+    whose mean depends on the class.
+    """
+    rng = random.Random(seed)
+    return {'class{}'.format(c): [{'p{}'.format(p): rng.gauss(c + p, 1.0)
+                                   for p in range(n_properties)}
+                                  for i in range(n_instances)]
+            for c in range(n_classes)}
+
+def percentile(sorted_values, fraction):
+    """ Nearest-rank percentile of an already sorted list. """
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+def measure(name, function, items, repeat=1, setup=None):
+    """
+    Calls `function(item)` for each item in `items`, `repeat` times, timing
+    each call. With `setup`, each call is `function(setup(item))` instead,
+    and only `function` is timed. Peak memory is measured in a separate
+    pass, since tracing allocations slows down the timed calls. Returns the
+    result dictionary for benchmark `name`.
+    """
+    latencies = []
+    total = 0.0
+    for i in range(repeat):
+        for item in items:
+            if setup is not None:
+                item = setup(item)
+            call_start = time.perf_counter()
+            function(item)
+            latencies.append(time.perf_counter() - call_start)
+            total += latencies[-1]
+
+    arguments = [setup(item) for item in items] if setup is not None else items
+    tracemalloc.start()
+    for argument in arguments:
+        function(argument)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {'name': name,
+            'operations': len(latencies),
+            'seconds': total,
+            'throughput': len(latencies) / total if total else None,
+            'p50': percentile(latencies, 0.50),
+            'p99': percentile(latencies, 0.99),
+            'peak_memory': peak_memory}
+
+def import_time(module='bayesian', repeat=5):
+    """
+    Returns the shortest time in seconds, out of `repeat` fresh
+    interpreters, to import `module` and everything it imports, as reported
+    by `python -X importtime`.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    times = []
+    for i in range(repeat):
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                                 cwd=root, stderr=subprocess.PIPE, universal_newlines=True,
+                                 check=True)
+        for line in process.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == module:
+                times.append(int(fields[1]) / 1e6)
+    return min(times)
+
+def run(vocabulary_size=5000, document_length=200, n_classes=4, n_documents=200,
+        n_queries=100, seed=0):
+    """
+    Runs every benchmark and returns the list of results. `n_documents` is
+    the number of training documents per class, and `n_queries` the number
+    of documents classified.
+    """
+    corpus = synthetic_corpus(vocabulary_size, document_length, n_classes, n_documents, seed)
+    queries = synthetic_corpus(vocabulary_size, document_length, n_classes,
+                               max(1, n_queries // n_classes), seed + 1)
+    queries = [document for documents in queries.values() for document in documents]
+    small_corpus = {class_: documents[:max(1, n_documents // 10)]
+                    for class_, documents in corpus.items()}
+    measures = synthetic_measures(10, n_classes, n_documents, seed)
+    measure_queries = [instance for instances in synthetic_measures(10, n_classes, 10, seed + 1).values()
+                       for instance in instances]
+
+    results = []
+    seconds = import_time()
+    results.append({'name': 'import bayesian', 'operations': 1, 'seconds': seconds,
+                    'throughput': 1 / seconds, 'p50': seconds, 'p99': seconds,
+                    'peak_memory': 0})
+    results.append(measure('extract_events_odds',
+                           lambda c: Bayes.extract_events_odds(c), [corpus]))
+    results.append(measure('NaiveBayesClassifier.__init__',
+                           lambda c: NaiveBayesClassifier(c), [corpus]))
+    classifier = NaiveBayesClassifier(corpus)
+    # Import the optional NumPy backend outside the measurement.
+    classifier.predict_batch(queries[:1])
+    results.append(measure('NaiveBayesClassifier.predict', classifier.predict, queries))
+    results.append(measure('NaiveBayesClassifier.predict_batch',
+                           classifier.predict_batch, [queries]))
+    # `classify` retrains for every call, so it uses a smaller corpus.
+    results.append(measure('classify',
+                           lambda q: classify(q, small_corpus), queries[:10]))
+    results.append(measure('classify_normal',
+                           lambda q: classify_normal(q, measures), measure_queries))
+
+    events_odds = Bayes.extract_events_odds(corpus)
+    priors = {class_: 1.0 for class_ in corpus}
+    documents_events = [query.split() for query in queries]
+    results.append(measure('Bayes.update_from_events',
+                           lambda events: Bayes(priors).update_from_events(events, events_odds),
+                           documents_events[:10]))
+    results.append(measure('Bayes.update_from_events(log_space=True)',
+                           lambda events: Bayes(priors).update_from_events(events, events_odds,
+                                                                           log_space=True),
+                           documents_events[:10]))
+    updates = [[events_odds[event][class_] for class_ in sorted(priors)]
+               for event in documents_events[0] if event in events_odds]
+    results.append(measure('Bayes.update', Bayes(priors).update, updates))
+
+    # Every call sorts a fresh folder, written before the call is timed.
+    parent = tempfile.mkdtemp()
+    try:
+        write = lambda arguments: _write_folder(tempfile.mkdtemp(dir=parent), *arguments)
+        results.append(measure('classify_folder', _classify_folder_quietly,
+                               [(small_corpus, queries[:20])], setup=write))
+    finally:
+        shutil.rmtree(parent)
+    return results
+
+def _classify_folder_quietly(root):
+    """ Sorts the inbox of `root` with `classify_folder`, without printing. """
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        bayesian.classify_folder(root)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+def _write_folder(root, corpus, queries):
+    """
+    Writes one subfolder per class and the `queries` files in `root`, and
+    returns `root`.
+    """
+    for class_, documents in corpus.items():
+        os.mkdir(os.path.join(root, class_))
+        for i, document in enumerate(documents):
+            with open(os.path.join(root, class_, str(i)), 'w') as f:
+                f.write(document)
+    for i, query in enumerate(queries):
+        with open(os.path.join(root, 'query{}'.format(i)), 'w') as f:
+            f.write(query)
+    return root
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--vocabulary', type=int, default=5000, help='distinct words in the corpus')
+    parser.add_argument('--length', type=int, default=200, help='words per document')
+    parser.add_argument('--classes', type=int, default=4, help='number of classes')
+    parser.add_argument('--documents', type=int, default=200, help='training documents per class')
+    parser.add_argument('--queries', type=int, default=100, help='documents to classify')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(arguments)
+
+    results = run(args.vocabulary, args.length, args.classes, args.documents,
+                  args.queries, args.seed)
+    report = {'python': sys.version.split()[0],
+              'parameters': vars(args),
+              'results': results}
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+if __name__ == '__main__':
+    main()
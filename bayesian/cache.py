@@ -0,0 +1,127 @@
+"""
+Prediction cache for inputs that repeat often, like notification templates or
+spam campaigns. Enable it on a trained classifier:
+
+    cache = classifier.enable_cache(max_entries=10000, max_bytes=2 ** 20)
+    classifier.predict(message)
+    print(cache.stats())
+
+Posteriors are keyed by a digest of the extracted features, so instances that
+differ only in ways the extractor ignores (order of events, case with a
+lowercasing extractor...) share an entry. Each entry is tagged with the
+model's `version`, which changes whenever the model is trained, so stale
+posteriors are never returned. Reloaded models get a new version and cache.
+"""
+from collections import OrderedDict
+import hashlib
+import sys
+import threading
+
+def features_key(features, *parameters):
+    """
+    Returns a 16 byte digest of `features`, either a list of events (order
+    doesn't matter) or a {property: value} dict, and `parameters`.
+    """
+    if isinstance(features, dict):
+        features = features.items()
+    try:
+        features = sorted(features)
+    except TypeError:
+        # Events of types that can't be compared with each other.
+        features = sorted(features, key=repr)
+    text = repr((features, parameters))
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+class PredictionCache(object):
+    """
+    Thread-safe LRU cache of posteriors for a single model, bounded to
+    `max_entries` entries and, if given, `max_bytes` approximate bytes.
+    Counts 'hits', 'misses', 'evictions' (entries dropped to respect the
+    limits) and 'invalidations' (entries dropped because the model changed).
+    """
+    def __init__(self, max_entries=10000, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._setup()
+
+    def _setup(self):
+        """ Creates the state that is not pickled. """
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.version = None
+        self._reset()
+
+    def _reset(self):
+        self._entries.clear()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __getstate__(self):
+        return {'max_entries': self.max_entries, 'max_bytes': self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._setup()
+
+    def _check_version(self, version):
+        """ Drops every entry if the model changed to `version`. Requires the lock. """
+        if version != self.version:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self.nbytes = 0
+            self.version = version
+
+    def key(self, features, *parameters):
+        """ Returns the key of `features`, see `features_key`. """
+        return features_key(features, *parameters)
+
+    def get(self, version, key):
+        """ Returns the posterior cached for `key` with model `version`, or None. """
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, version, key, posterior):
+        """ Caches the `posterior` (a tuple of floats) of `key` with model `version`. """
+        size = sys.getsizeof(key) + sys.getsizeof(posterior) + 24 * len(posterior)
+        with self._lock:
+            self._check_version(version)
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous[1]
+            self._entries[key] = (posterior, size)
+            self.nbytes += size
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or self.max_bytes is not None and self.nbytes > self.max_bytes):
+                evicted_key, (evicted, evicted_size) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        """ Empties the cache and resets the counters. """
+        with self._lock:
+            self._reset()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """ Returns the counters, number of entries and approximate bytes used. """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_rate': self.hits / float(lookups) if lookups else None,
+                    'evictions': self.evictions,
+                    'invalidations': self.invalidations,
+                    'entries': len(self._entries),
+                    'bytes': self.nbytes}
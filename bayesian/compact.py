@@ -0,0 +1,170 @@
+"""
+Compact belief type for large numbers of classes. `CompactBayes` stores its
+odds in a contiguous array of doubles instead of a list of float objects, and
+its arithmetic operators modify it in place.
+"""
+from array import array
+from operator import mul
+
+from bayesian import Bayes
+
+class CompactBayes(object):
+    """
+    Array-backed alternative to `Bayes`, using a quarter of the memory per
+    class and updating in place. It accepts the same values as `Bayes` and
+    supports label lookup, updates and the most likely label, but it's not a
+    list: convert with `to_bayes` for anything else.
+    """
+    __slots__ = ('labels', '_label_index', 'values')
+
+    def __init__(self, value=None, labels=None):
+        """
+        Creates a new belief system from `value` and `labels`, which are
+        interpreted the same way as in `Bayes`.
+        """
+        b = value if isinstance(value, Bayes) else Bayes(value, labels)
+        self.labels = b.labels
+        self._label_index = b._label_index
+        self.values = array('d', b)
+
+    @classmethod
+    def _from_array(cls, values, labels, label_index):
+        """ Creates an instance from already validated parts, without copying. """
+        self = cls.__new__(cls)
+        self.labels = labels
+        self._label_index = label_index
+        self.values = values
+        return self
+
+    def _odds(self, other):
+        """ Converts `other` into an iterable of odds in label order. """
+        if isinstance(other, CompactBayes):
+            return other.values
+        if isinstance(other, dict):
+            return [other[label] for label in self.labels]
+        # Lists and arrays (e.g. `events_odds` values) are used as they are.
+        if not isinstance(other, (list, array)):
+            other = list(other)
+        if len(other) and isinstance(other[0], tuple):
+            # List of (label, odds) tuples.
+            return [odds for label, odds in other]
+        return other
+
+    def _index(self, i):
+        if isinstance(i, str):
+            try:
+                return self._label_index[i]
+            except KeyError:
+                raise ValueError('{!r} is not a label. Labels: {}.'.format(i, self.labels))
+        return i
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __getitem__(self, i):
+        """ Returns the odds at index or label `i`. """
+        return self.values[self._index(i)]
+
+    def __setitem__(self, i, value):
+        """ Sets the odds at index or label `i`. """
+        self.values[self._index(i)] = value
+
+    def copy(self):
+        """ Returns a copy with its own array of odds. """
+        return CompactBayes._from_array(array('d', self.values), self.labels, self._label_index)
+
+    def to_bayes(self):
+        """ Returns the equivalent `Bayes` object. """
+        return Bayes(list(self.values), self.labels)
+
+    def __imul__(self, other):
+        """
+        Multiplies each odd by the matching odd in `other`, in place.
+        Ex: [.5, .5] *= [.9, .1] -> [.45, .05] (non normalized)
+        """
+        self.values[:] = array('d', map(mul, self.values, self._odds(other)))
+        return self
+
+    def __itruediv__(self, other):
+        """
+        Divides each odd by the matching odd in `other`, in place. Division by
+        zero results in zero, like `Bayes.opposite`.
+        """
+        values = self.values
+        for i, odds in enumerate(self._odds(other)):
+            values[i] = values[i] / odds if odds != 0 else 0
+        return self
+
+    def __mul__(self, other):
+        return self.copy().__imul__(other)
+
+    def __truediv__(self, other):
+        return self.copy().__itruediv__(other)
+
+    def normalize(self):
+        """
+        Converts the odds into probabilities that sum to 1, in place.
+        """
+        return self._set_normalized(self.values)
+
+    def _set_normalized(self, values):
+        """ Stores `values` divided by their sum (zeros if it's 0) and returns itself. """
+        total = float(sum(values))
+        if total:
+            self.values[:] = array('d', [value / total for value in values])
+        else:
+            self.values[:] = array('d', [0.0]) * len(values)
+        return self
+
+    def normalized(self):
+        """ Returns a normalized copy. """
+        return self.copy().normalize()
+
+    def update(self, event):
+        """
+        Updates all current odds based on the likelihood of odds in event, in
+        place, and returns itself.
+        """
+        # Multiplied and normalized with a single write to the array.
+        return self._set_normalized(list(map(mul, self.values, self._odds(event))))
+
+    def update_from_events(self, events, events_odds):
+        """
+        Perform an update for every event in events, taking the new odds from
+        the dictionary events_odds (if available).
+        """
+        for event in events:
+            if event in events_odds:
+                self.update(events_odds[event])
+        return self
+
+    def most_likely(self, cutoff=0.0):
+        """
+        Returns the label with most probability, or None if its probability is
+        under `cutoff`.
+        """
+        total = float(sum(self.values))
+        if not self.values or total == 0:
+            return None
+        i = max(range(len(self.values)), key=self.values.__getitem__)
+        return self.labels[i] if self.values[i] / total > cutoff else None
+
+    def is_likely(self, label, minimum_probability=0.5):
+        """
+        Returns if `label` has at least probability `minimum_probability`.
+        """
+        total = float(sum(self.values))
+        return total != 0 and self[label] / total > minimum_probability
+
+    def __repr__(self):
+        return 'Compact' + repr(self.to_bayes())
+
+    def __eq__(self, other):
+        if isinstance(other, CompactBayes):
+            other = other.to_bayes()
+        return self.to_bayes() == other
+
+    __hash__ = None
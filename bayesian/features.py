@@ -0,0 +1,136 @@
+"""
+Feature extraction pipeline to use as the `extractor` argument of the
+classification functions, instead of a bare function like `str.split`:
+
+    extractor = Extractor(pattern=WORDS, lowercase=True, ngrams=(1, 2),
+                          stop_words=['the', 'a'], cache_size=10000)
+    classify(message, classes_instances, extractor)
+
+Extractors are picklable (the cache is not pickled), so they also work with
+`bayesian.parallel.train_parallel`.
+"""
+from collections import OrderedDict
+import hashlib
+import re
+import threading
+import zlib
+
+# Sequences of letters, digits and underscores.
+WORDS = r'\w+'
+# Words, plus runs of any other non-space characters, e.g. punctuation.
+WORDS_AND_SYMBOLS = r'\w+|[^\w\s]+'
+
+def content_hash(instance):
+    """ Returns a short digest of a str or bytes `instance`, used as cache key. """
+    if isinstance(instance, str):
+        instance = instance.encode('utf-8', 'surrogatepass')
+    return hashlib.blake2b(instance, digest_size=16).digest()
+
+def hash_event(event, n_buckets):
+    """
+    Maps `event` to an int in range(n_buckets), the same in every process
+    (unlike the built-in `hash`).
+    """
+    return zlib.crc32(event.encode('utf-8', 'surrogatepass')) % n_buckets
+
+class Extractor(object):
+    """
+    Converts instances (strings) into lists of events in stages: tokenize,
+    lowercase, remove stop words, build n-grams, and hash into a bounded
+    number of buckets. Each stage is optional.
+    """
+    def __init__(self, pattern=None, lowercase=False, stop_words=(), ngrams=1,
+                 hashing=None, cache_size=0):
+        """
+        `pattern` is a regular expression matching each token (e.g. `WORDS`),
+        defaulting to whitespace splitting like `str.split`. `ngrams` is
+        either n or a (min n, max n) tuple, with n-grams joined by spaces.
+        `hashing`, if set, is the number of buckets events are hashed into,
+        making them ints. `cache_size` is the number of instances whose
+        events are kept in an LRU cache keyed by content hash, so repeated
+        instances are not tokenized again.
+        """
+        self.pattern = pattern
+        self.lowercase = lowercase
+        self.stop_words = frozenset(stop_words)
+        self.ngrams = (ngrams, ngrams) if isinstance(ngrams, int) else tuple(ngrams)
+        if not 1 <= self.ngrams[0] <= self.ngrams[1]:
+            raise ValueError('Invalid n-gram range {}.'.format(self.ngrams))
+        self.hashing = hashing
+        self.cache_size = cache_size
+        self._setup()
+
+    def _setup(self):
+        """ Creates the state that is not pickled. """
+        self._regex = re.compile(self.pattern) if self.pattern is not None else None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ('_regex', '_cache', '_lock', 'hits', 'misses'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._setup()
+
+    def tokenize(self, instance):
+        """ Splits `instance` into tokens, lowercased if configured. """
+        if self.lowercase:
+            instance = instance.lower()
+        if self._regex is None:
+            return instance.split()
+        return self._regex.findall(instance)
+
+    def extract(self, instance):
+        """ Runs every stage on `instance`, without the cache. """
+        tokens = self.tokenize(instance)
+        if self.stop_words:
+            tokens = [token for token in tokens if token not in self.stop_words]
+
+        min_n, max_n = self.ngrams
+        if max_n == 1:
+            events = tokens
+        else:
+            events = []
+            for n in range(min_n, max_n + 1):
+                if n == 1:
+                    events.extend(tokens)
+                else:
+                    events.extend(' '.join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+
+        if self.hashing:
+            events = [hash_event(event, self.hashing) for event in events]
+        return events
+
+    def __call__(self, instance):
+        """ Returns the list of events of `instance`, using the cache if enabled. """
+        if not self.cache_size:
+            return self.extract(instance)
+
+        key = content_hash(instance)
+        with self._lock:
+            events = self._cache.get(key)
+            if events is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return list(events)
+            self.misses += 1
+
+        events = self.extract(instance)
+        with self._lock:
+            self._cache[key] = tuple(events)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return events
+
+    def clear_cache(self):
+        """ Empties the cache and resets the hit and miss counters. """
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
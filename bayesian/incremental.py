@@ -0,0 +1,252 @@
+"""
+Incremental version of `bayesian.classify_folder`, for folders that are
+sorted repeatedly (e.g. from cron) while files keep arriving:
+
+    classify_folder('inbox', index='inbox-index')
+
+The index directory keeps the trained model, the size, modification time and
+content hash of every file in the subfolders, and the event counts of each
+distinct content. Each pass only reads the files that were added or changed
+since the last one, subtracts the counts of files that were removed, reuses
+the counts of files moved between subfolders, and classifies only inbox files
+it hasn't seen, so its cost depends on the changes instead of the corpus.
+
+The index directory is marked with an `INDEX_MARKER` file, so it's never
+taken for a class, even by the plain `bayesian.classify_folder`, when it's
+inside the folder.
+
+The counts depend on the extractor, so the index must be deleted when the
+extractor changes. Events must be strings or ints, to be stored as JSON.
+
+Every file is written to a temporary file and renamed into place, so
+concurrent readers and crashes never see partial files. The model is saved
+under a new name each time and `files.json`, which names it, is written
+last, so a crash leaves either the old or the new state, never a mix.
+"""
+from collections import Counter
+import json
+import os
+import tempfile
+import time
+
+from bayesian import NaiveBayesClassifier, Bayes, read_file, imap_bounded, INDEX_MARKER
+from bayesian.features import content_hash
+
+def replace_atomically(path, write):
+    """
+    Calls `write(temporary_path)` with a new file in the directory of
+    `path`, then renames it to `path`.
+    """
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.', suffix='.tmp')
+    os.close(fd)
+    try:
+        write(temporary)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+def write_json(path, value):
+    """ Writes `value` as JSON to `path`, atomically. """
+    def write(temporary):
+        with open(temporary, 'w') as f:
+            json.dump(value, f)
+    replace_atomically(path, write)
+
+class FolderIndex(object):
+    """
+    Persistent state of an incrementally classified folder, stored in the
+    directory `path`: `files` maps each labeled file, as 'label/name', to
+    [label, size, mtime_ns, hash], `inbox` maps each inbox file name already
+    classified to [size, mtime_ns], and `model` is trained with the counts of
+    every file in `files`. `files.json` also names the file of the model,
+    which changes with every `save`.
+    """
+    def __init__(self, path, extractor=str.split):
+        self.path = path
+        self.extractor = extractor
+        self.counts_path = os.path.join(path, 'counts')
+        os.makedirs(self.counts_path, exist_ok=True)
+        # So that sorting the folder without the index ignores it.
+        marker = os.path.join(path, INDEX_MARKER)
+        if not os.path.exists(marker):
+            open(marker, 'w').close()
+        self.files = {}
+        self.inbox = {}
+        self.model_name = None
+        self.model = NaiveBayesClassifier(extractor=extractor)
+        files_path = os.path.join(path, 'files.json')
+        if os.path.exists(files_path):
+            with open(files_path) as f:
+                state = json.load(f)
+            self.files = state['files']
+            self.inbox = state['inbox']
+            self.model_name = state['model']
+            self.model = NaiveBayesClassifier.load(os.path.join(path, self.model_name),
+                                                   extractor, mmap=False)
+        self.changed = False
+
+    def _counts_file(self, hash_):
+        return os.path.join(self.counts_path, hash_ + '.json')
+
+    def load_counts(self, hash_):
+        """ Returns the stored Counter of events of the contents with `hash_`. """
+        with open(self._counts_file(hash_)) as f:
+            return Counter(dict(json.load(f)))
+
+    def store_counts(self, hash_, events_counts):
+        # Atomic, since threads reading files with the same contents may
+        # store and load the same counts at once.
+        write_json(self._counts_file(hash_), list(events_counts.items()))
+
+    def _read(self, path):
+        """
+        Returns the (hash, events counts) of the file at `path`, running the
+        extractor only if no file with the same contents was seen before.
+        """
+        contents = read_file(path)
+        hash_ = content_hash(contents).hex()
+        if os.path.exists(self._counts_file(hash_)):
+            return hash_, self.load_counts(hash_)
+        events_counts = Counter(self.extractor(contents))
+        self.store_counts(hash_, events_counts)
+        return hash_, events_counts
+
+    def add_file(self, key, label, stat, hash_, events_counts):
+        """ Records the file `key` ('label/name') and trains the model with it. """
+        self.files[key] = [label, stat.st_size, stat.st_mtime_ns, hash_]
+        self.model._add_counts(events_counts, label)
+        self.changed = True
+
+    def remove_file(self, key):
+        """ Forgets the file `key` and subtracts its counts from the model. """
+        label, size, mtime, hash_ = self.files.pop(key)
+        self.model._add_counts(self.load_counts(hash_), label, sign=-1)
+        self.changed = True
+
+    def rebuild(self):
+        """ Retrains the model from the stored counts of every indexed file. """
+        self.model = NaiveBayesClassifier(extractor=self.extractor)
+        for label, size, mtime, hash_ in self.files.values():
+            self.model._add_counts(self.load_counts(hash_), label)
+        self.changed = True
+
+    def sync(self, folder, workers=None):
+        """
+        Updates the model with the changes in the subfolders of `folder`
+        since the last pass, reading only new or modified files, with
+        `workers` threads. Returns the number of files 'added', 'removed'
+        and 'unchanged'.
+        """
+        index_path = os.path.abspath(self.path)
+        current = {}
+        for entry in os.scandir(folder):
+            if (not entry.is_dir() or os.path.abspath(entry.path) == index_path
+                    or os.path.exists(os.path.join(entry.path, INDEX_MARKER))):
+                continue
+            for child in os.scandir(entry.path):
+                if child.is_file():
+                    current[entry.name + '/' + child.name] = (entry.name, child.path, child.stat())
+
+        removed = [key for key, (label, size, mtime, hash_) in self.files.items()
+                   if key not in current
+                   or (current[key][2].st_size, current[key][2].st_mtime_ns) != (size, mtime)]
+        for key in removed:
+            self.remove_file(key)
+
+        # Classes whose folder is gone can't be subtracted away.
+        labels = set(label for label, path, stat in current.values())
+        if set(self.model.labels) - labels:
+            self.rebuild()
+
+        added = [(key, label, path, stat) for key, (label, path, stat) in current.items()
+                 if key not in self.files]
+        read = lambda item: (item, self._read(item[2]))
+        for (key, label, path, stat), (hash_, events_counts) in imap_bounded(read, added, workers):
+            self.add_file(key, label, stat, hash_, events_counts)
+        return {'added': len(added), 'removed': len(removed),
+                'unchanged': len(current) - len(added)}
+
+    def classify_inbox(self, folder, workers=None):
+        """
+        Moves each file directly in `folder` that was not seen before into
+        the subfolder of its most likely class, training the model with it.
+        Returns the number of files moved.
+        """
+        if not self.model.labels:
+            return 0
+        inbox = {}
+        new = []
+        for entry in os.scandir(folder):
+            if entry.is_file():
+                stat = entry.stat()
+                inbox[entry.name] = [stat.st_size, stat.st_mtime_ns]
+                if self.inbox.get(entry.name) != inbox[entry.name]:
+                    new.append(entry.path)
+
+        moved = 0
+        read = lambda path: (path, self._read(path))
+        for path, (hash_, events_counts) in imap_bounded(read, new, workers):
+            scores = self.model._log_scores(events_counts.elements())
+            label = Bayes.from_log_odds(scores, self.model.labels).most_likely()
+            if label is None:
+                continue
+            name = os.path.basename(path)
+            new_path = os.path.join(folder, label, name)
+            if not os.path.exists(new_path):
+                print(path, os.path.join(folder, label))
+                os.rename(path, new_path)
+                self.add_file(label + '/' + name, label, os.stat(new_path), hash_, events_counts)
+                del inbox[name]
+                moved += 1
+        if inbox != self.inbox:
+            self.inbox = inbox
+            self.changed = True
+        return moved
+
+    def save(self):
+        """
+        Writes the model under a new name, then the index pointing to it, and
+        deletes the previous model and the counts no file uses anymore.
+        """
+        if not self.changed:
+            return
+        generation = int(self.model_name[len('model-'):-len('.bin')]) + 1 if self.model_name else 1
+        model_name = 'model-{}.bin'.format(generation)
+        replace_atomically(os.path.join(self.path, model_name), self.model.save)
+        write_json(os.path.join(self.path, 'files.json'),
+                   {'files': self.files, 'inbox': self.inbox, 'model': model_name})
+        self.model_name = model_name
+        for name in os.listdir(self.path):
+            if name.startswith('model-') and name != model_name or name.endswith('.tmp'):
+                os.remove(os.path.join(self.path, name))
+        used = set(hash_ + '.json' for label, size, mtime, hash_ in self.files.values())
+        for name in os.listdir(self.counts_path):
+            if name not in used:
+                os.remove(os.path.join(self.counts_path, name))
+        self.changed = False
+
+def classify_folder(folder, index, extractor=str.split, workers=None):
+    """
+    Same as `bayesian.classify_folder`, but keeping the model and file
+    metadata in the directory `index` between calls, so each call only
+    reads what changed. Returns the `sync` counts plus the number of inbox
+    files 'moved'.
+    """
+    folder_index = FolderIndex(index, extractor)
+    changes = folder_index.sync(folder, workers)
+    changes['moved'] = folder_index.classify_inbox(folder, workers)
+    folder_index.save()
+    return changes
+
+def watch(folder, index, extractor=str.split, workers=None, interval=60.0, passes=None):
+    """
+    Calls `classify_folder` every `interval` seconds, `passes` times or
+    forever.
+    """
+    n = 0
+    while passes is None or n < passes:
+        if n:
+            time.sleep(interval)
+        classify_folder(folder, index, extractor, workers)
+        n += 1
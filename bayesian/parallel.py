@@ -0,0 +1,54 @@
+"""
+Parallel training of `NaiveBayesClassifier` across a pool of processes. Each
+worker runs the extractor and counts events for a chunk of the corpus, and the
+per-chunk count tables are merged into a single model, with the same result
+as training serially.
+"""
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import os
+
+from bayesian import NaiveBayesClassifier
+
+def count_events(extractor, labeled_instances):
+    """
+    Runs `extractor` on every (label, instance) pair in `labeled_instances`
+    and returns the counts of events for each label, as {label: Counter}.
+    """
+    labels_counts = {}
+    for label, instance in labeled_instances:
+        labels_counts.setdefault(label, Counter()).update(extractor(instance))
+    return labels_counts
+
+def chunks(items, size):
+    """ Splits the list `items` into lists of at most `size` elements. """
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def train_parallel(classes_instances, extractor=str.split, priors=None,
+                   workers=None, chunk_size=None):
+    """
+    Same as `NaiveBayesClassifier(classes_instances, extractor, priors)`, but
+    runs `extractor` and the counting over `workers` processes (defaults to
+    the number of CPUs). `extractor` must be picklable, e.g. a module-level
+    function.
+
+    The corpus is split in chunks of `chunk_size` instances, by default
+    enough for four chunks per worker to balance uneven instances.
+    """
+    workers = workers or os.cpu_count() or 1
+    priors = priors or {class_: 1.0 for class_ in classes_instances}
+    # Classes left out of explicit priors are not trained, as in the constructor.
+    labeled_instances = [(class_, instance)
+                         for class_, instances in classes_instances.items() if class_ in priors
+                         for instance in instances]
+    chunk_size = chunk_size or max(1, -(-len(labeled_instances) // (workers * 4)))
+
+    # Create every class upfront, so merging never has to add labels.
+    classifier = NaiveBayesClassifier(extractor=extractor, priors=priors)
+    with ProcessPoolExecutor(workers) as executor:
+        for labels_counts in executor.map(count_events, repeat(extractor),
+                                          chunks(labeled_instances, chunk_size)):
+            for label, events_counts in labels_counts.items():
+                classifier._add_counts(events_counts, label)
+    return classifier
@@ -0,0 +1,287 @@
+"""
+Long-lived classification server for a saved model (see
+`NaiveBayesClassifier.save`), loaded once and queried over local HTTP or a
+line-delimited JSON protocol on stdin/stdout:
+
+    python -m bayesian serve --model model.bin --port 8000
+    python -m bayesian serve --model model.bin --stdin
+
+HTTP: POST /classify with {"instances": [...]} returns {"results": [...]},
+and {"instance": ...} returns a single result. GET /metrics returns counters
+in the Prometheus text format.
+
+stdin: each line is a JSON instance, or {"id": ..., "instance": ...}, and
+gets one line back with the result (and the same id), in order.
+
+Each result is {"label": ..., "probabilities": {label: probability}}.
+With `--cache`, results of repeated instances are cached (see
+`bayesian.cache`) and the cache counters are added to /metrics.
+Requests are queued and scored by `workers` threads, each taking up to
+`batch` queued instances at a time for a single `predict_batch` call, so
+concurrent requests share the scoring cost.
+"""
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import importlib
+import json
+import queue
+import sys
+import threading
+import time
+
+from bayesian import NaiveBayesClassifier, HashedNaiveBayesClassifier, score_batch
+
+class Metrics(object):
+    """
+    Thread-safe counters of the work done by a server, plus the counters of
+    the model's prediction `cache` if given.
+    """
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.instances = 0
+        self.batches = 0
+        self.errors = 0
+        self.scoring_seconds = 0.0
+
+    def add(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def render(self):
+        """ Returns the counters in the Prometheus text format. """
+        with self.lock:
+            values = [('requests_total', 'counter', self.requests),
+                      ('instances_total', 'counter', self.instances),
+                      ('batches_total', 'counter', self.batches),
+                      ('errors_total', 'counter', self.errors),
+                      ('scoring_seconds_total', 'counter', self.scoring_seconds),
+                      ('uptime_seconds', 'gauge', time.time() - self.started)]
+        if self.cache is not None:
+            stats = self.cache.stats()
+            values += [('cache_hits_total', 'counter', stats['hits']),
+                       ('cache_misses_total', 'counter', stats['misses']),
+                       ('cache_evictions_total', 'counter', stats['evictions']),
+                       ('cache_invalidations_total', 'counter', stats['invalidations']),
+                       ('cache_entries', 'gauge', stats['entries']),
+                       ('cache_bytes', 'gauge', stats['bytes'])]
+        return ''.join('# TYPE bayesian_{0} {1}\nbayesian_{0} {2}\n'.format(name, type_, value)
+                       for name, type_, value in values)
+
+class Batcher(object):
+    """
+    Queue of instances scored in batches of at most `batch_size` by
+    `workers` threads. `submit` returns a Future with the result.
+    """
+    def __init__(self, classifier, batch_size=64, workers=1, metrics=None):
+        self.classifier = classifier
+        self.batch_size = batch_size
+        self.metrics = metrics or Metrics(getattr(classifier, 'cache', None))
+        self.queue = queue.Queue()
+        self.threads = [threading.Thread(target=self._work, daemon=True)
+                        for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, instance):
+        future = Future()
+        self.queue.put((instance, future))
+        return future
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    # Leave the stop signal for the next iteration.
+                    self.queue.put(None)
+                    break
+                batch.append(item)
+            self._score(batch)
+
+    def _score(self, batch):
+        """
+        Scores `batch`, a list of (instance, future). Only the instances that
+        fail get an exception, see `score_batch`. This is the only place
+        scoring errors are counted.
+        """
+        start = time.perf_counter()
+        results = score_batch(self.classifier, [instance for instance, future in batch])
+        errors = sum(1 for result in results if isinstance(result, Exception))
+        self.metrics.add(instances=len(batch) - errors, batches=1, errors=errors,
+                         scoring_seconds=time.perf_counter() - start)
+        labels = self.classifier.labels
+        for (instance, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                label, row = result
+                future.set_result({'label': label,
+                                   'probabilities': dict(zip(labels, map(float, row)))})
+
+    def classify(self, instances):
+        """ Returns the list of results of `instances`, waiting for them. """
+        return [future.result() for future in [self.submit(instance) for instance in instances]]
+
+    def close(self):
+        """ Stops the workers after the queued instances are scored. """
+        for thread in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+
+class Handler(BaseHTTPRequestHandler):
+    """ HTTP interface of a `Batcher`, set as the server's `batcher` attribute. """
+    def _send(self, status, body, content_type='application/json'):
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self._send(200, self.server.batcher.metrics.render(), 'text/plain; version=0.0.4')
+        else:
+            self._send(404, json.dumps({'error': 'Not found.'}))
+
+    def do_POST(self):
+        if self.path != '/classify':
+            return self._send(404, json.dumps({'error': 'Not found.'}))
+        batcher = self.server.batcher
+        batcher.metrics.add(requests=1)
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+            batched = 'instances' in request
+            instances = request['instances'] if batched else [request['instance']]
+            if not isinstance(instances, list):
+                raise TypeError('"instances" must be a list.')
+        except (ValueError, KeyError, TypeError) as e:
+            batcher.metrics.add(errors=1)
+            return self._send(400, json.dumps({'error': str(e)}))
+        # Scoring errors are counted by the batcher.
+        try:
+            results = batcher.classify(instances)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            return self._send(400, json.dumps({'error': str(e)}))
+        except Exception as e:
+            return self._send(500, json.dumps({'error': str(e)}))
+        self._send(200, json.dumps({'results': results} if batched else results[0]))
+
+    def log_message(self, format, *args):
+        # Logging every request to stderr would dominate the response time.
+        pass
+
+def make_http_server(batcher, host='127.0.0.1', port=8000):
+    """ Returns an HTTP server answering with `batcher`, not yet started. """
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.batcher = batcher
+    return server
+
+def serve_lines(batcher, input_lines, output):
+    """
+    Answers each JSON line in `input_lines` with a JSON line in `output`, in
+    order. Lines are submitted as soon as they are read, so the workers can
+    batch them while earlier results are written.
+    """
+    pending = queue.Queue()
+
+    def write_results():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            id_, future = item
+            try:
+                response = future.result()
+            except Exception as e:
+                response = {'error': str(e)}
+            if id_ is not None:
+                response = dict(response, id=id_)
+            output.write(json.dumps(response) + '\n')
+            output.flush()
+
+    writer = threading.Thread(target=write_results)
+    writer.start()
+    try:
+        for line in input_lines:
+            if not line.strip():
+                continue
+            batcher.metrics.add(requests=1)
+            id_ = None
+            future = Future()
+            try:
+                request = json.loads(line)
+                if isinstance(request, dict):
+                    id_ = request.get('id')
+                    request = request['instance']
+            except (ValueError, KeyError) as e:
+                batcher.metrics.add(errors=1)
+                future.set_exception(e)
+            else:
+                future = batcher.submit(request)
+            pending.put((id_, future))
+    finally:
+        pending.put(None)
+        writer.join()
+
+def load_model(path, extractor=str.split):
+    """ Loads a model saved by `NaiveBayesClassifier` or its hashed variant. """
+    try:
+        return NaiveBayesClassifier.load(path, extractor)
+    except ValueError:
+        return HashedNaiveBayesClassifier.load(path, extractor)
+
+def import_function(name):
+    """ Returns the object at 'module.attribute', e.g. 'mymodule.extract'. """
+    module, _, attribute = name.rpartition('.')
+    return getattr(importlib.import_module(module), attribute)
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(prog='python -m bayesian serve',
+                                     description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--model', required=True, help='path of a saved model')
+    parser.add_argument('--extractor', help='module.function extracting events from instances '
+                                            '(default: str.split)')
+    parser.add_argument('--stdin', action='store_true', help='read JSON lines from stdin '
+                                                             'instead of serving HTTP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--batch', type=int, default=64, help='maximum instances per batch')
+    parser.add_argument('--workers', type=int, default=1, help='scoring threads')
+    parser.add_argument('--cache', type=int, default=0, metavar='ENTRIES',
+                        help='cache the results of up to ENTRIES distinct instances')
+    args = parser.parse_args(arguments)
+
+    extractor = import_function(args.extractor) if args.extractor else str.split
+    classifier = load_model(args.model, extractor)
+    if args.cache:
+        classifier.enable_cache(args.cache)
+    batcher = Batcher(classifier, args.batch, args.workers)
+    try:
+        if args.stdin:
+            serve_lines(batcher, sys.stdin, sys.stdout)
+        else:
+            server = make_http_server(batcher, args.host, args.port)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.server_close()
+    finally:
+        batcher.close()
@@ -0,0 +1,85 @@
+"""
+Opt-in instrumentation of training and scoring. Disabled by default, when it
+costs one None check per hot path call:
+
+    from bayesian import stats
+    collected = stats.enable()
+    classifier.predict_batch(messages)
+    print(collected.snapshot())
+    stats.disable()
+
+Work is recorded per stage, with the time spent in it and counters:
+
+    extract   running the extractor            documents
+    score     NaiveBayesClassifier scoring     events, misses (unknown events)
+    train     adding counts to a model         trained_events
+    count     Bayes.extract_events_odds        documents
+    lookup    Bayes.update_from_events         events, misses
+    update    Bayes.update                     updates
+    gaussian  Gaussian densities               documents, densities
+
+A `hook(stage, seconds, counts)` can be given to export each record as it
+happens, e.g. to a monitoring client.
+"""
+from collections import Counter
+from contextlib import contextmanager
+import threading
+
+import bayesian
+
+class Stats(object):
+    """ Thread-safe totals of calls, seconds and counters for each stage. """
+    def __init__(self, hook=None):
+        self.hook = hook
+        self.lock = threading.Lock()
+        self.reset()
+
+    def record(self, stage, seconds=0.0, **counts):
+        """ Adds one call to `stage` that took `seconds`, with `counts`. """
+        with self.lock:
+            self.calls[stage] += 1
+            self.seconds[stage] += seconds
+            self.counters.update(counts)
+        if self.hook is not None:
+            self.hook(stage, seconds, counts)
+
+    def reset(self):
+        with self.lock:
+            self.calls = Counter()
+            self.seconds = Counter()
+            self.counters = Counter()
+
+    def snapshot(self):
+        """
+        Returns a copy of the totals as {'calls': {stage: n}, 'seconds':
+        {stage: seconds}, 'counters': {name: n}}.
+        """
+        with self.lock:
+            return {'calls': dict(self.calls),
+                    'seconds': dict(self.seconds),
+                    'counters': dict(self.counters)}
+
+def enable(hook=None):
+    """ Starts recording in a new `Stats`, and returns it. """
+    bayesian._stats = Stats(hook)
+    return bayesian._stats
+
+def disable():
+    """ Stops recording, and returns the `Stats` that were being recorded. """
+    stats = bayesian._stats
+    bayesian._stats = None
+    return stats
+
+def current():
+    """ Returns the `Stats` being recorded, or None if disabled. """
+    return bayesian._stats
+
+@contextmanager
+def recording(hook=None):
+    """ Enables stats inside a `with` block, restoring the previous state after. """
+    previous = bayesian._stats
+    stats = enable(hook)
+    try:
+        yield stats
+    finally:
+        bayesian._stats = previous
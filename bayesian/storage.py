@@ -0,0 +1,221 @@
+"""
+Binary file format for trained `NaiveBayesClassifier` models, designed to be
+memory-mapped: loading only parses a small header, and every process mapping
+the same file shares a single copy of it in the page cache.
+
+Layout, with every section aligned to 8 bytes:
+
+    magic         b'BAYESNB1'
+    header size   uint64, little endian
+    header        JSON with labels, priors, smoothing, largest count, type of
+                  the counts and section positions
+    key offsets   uint64[events + 1], where each event's key bytes start
+    keys          encoded events, in row order
+    hash table    int64[slots], row + 1 of the key hashed to each slot (0 if
+                  empty), with linear probing
+    counts        int32[events * labels], or int64 if a count didn't fit
+    log odds      float64[events * labels]
+
+Events are encoded with a one byte type tag, so only str, bytes and int
+events can be saved. Models of a HashedNaiveBayesClassifier store no keys, and
+their bucket width in the header.
+"""
+from array import array
+import json
+import mmap as mmap_module
+import struct
+import sys
+import zlib
+
+from bayesian import index_labels, HashedVocabulary
+
+MAGIC = b'BAYESNB1'
+
+def encode_event(event):
+    """ Converts an event into the key bytes used in the file. """
+    if isinstance(event, str):
+        # Lone surrogates (e.g. from undecodable file names) are kept as is.
+        return b's' + event.encode('utf-8', 'surrogatepass')
+    elif isinstance(event, bytes):
+        return b'b' + event
+    elif isinstance(event, int) and not isinstance(event, bool):
+        return b'i' + str(event).encode('ascii')
+    raise TypeError('Cannot save event of type {}: {!r}.'.format(type(event).__name__, event))
+
+def decode_event(key):
+    """ Inverse of `encode_event`. """
+    tag, value = key[:1], key[1:]
+    if tag == b's':
+        return value.decode('utf-8', 'surrogatepass')
+    elif tag == b'b':
+        return value
+    return int(value)
+
+def _table_size(n_events):
+    """ Power of two with at least twice as many slots as events. """
+    size = 1
+    while size < 2 * n_events:
+        size *= 2
+    return size
+
+class MappedVocabulary(object):
+    """
+    Read-only {event: row} mapping over the keys and hash table of a mapped
+    model file, so loading doesn't have to build a dictionary.
+    """
+    def __init__(self, offsets, keys, table):
+        self.offsets = offsets
+        self.keys = keys
+        self.table = table
+        self.mask = len(table) - 1
+        self.nbytes = offsets.nbytes + keys.nbytes + table.nbytes
+
+    def _key(self, row):
+        return self.keys[self.offsets[row]:self.offsets[row + 1]]
+
+    def get(self, event, default=None):
+        try:
+            key = encode_event(event)
+        except (TypeError, UnicodeError):
+            return default
+        slot = zlib.crc32(key) & self.mask
+        while True:
+            row = self.table[slot]
+            if row == 0:
+                return default
+            if self._key(row - 1) == key:
+                return row - 1
+            slot = (slot + 1) & self.mask
+
+    def __contains__(self, event):
+        return self.get(event) is not None
+
+    def __getitem__(self, event):
+        row = self.get(event)
+        if row is None:
+            raise KeyError(event)
+        return row
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield decode_event(self._key(row).tobytes())
+
+    def items(self):
+        return zip(self, range(len(self)))
+
+def save(classifier, path):
+    """
+    Writes the trained `classifier` to `path`. Labels must be strings or
+    numbers, since they are stored as JSON.
+    """
+    n_labels = len(classifier.labels)
+    width = getattr(classifier, 'width', None)
+    # Hashed models have no vocabulary to store.
+    keys = [encode_event(event) for event in classifier.events] if width is None else []
+    offsets = array('Q', [0])
+    for key in keys:
+        offsets.append(offsets[-1] + len(key))
+    table = array('q', [0]) * _table_size(len(keys))
+    counts = classifier.counts
+    counts_type = counts.typecode if isinstance(counts, array) else counts.format
+    mask = len(table) - 1
+    for row, key in enumerate(keys):
+        slot = zlib.crc32(key) & mask
+        while table[slot]:
+            slot = (slot + 1) & mask
+        table[slot] = row + 1
+
+    sections = [('offsets', offsets.tobytes()),
+                ('keys', b''.join(keys)),
+                ('table', table.tobytes()),
+                ('counts', classifier.counts.tobytes()),
+                ('log_odds', array('d', classifier.log_odds).tobytes())]
+    positions = {}
+    position = 0
+    for name, data in sections:
+        positions[name] = [position, len(data)]
+        position += len(data) + -len(data) % 8
+
+    header = json.dumps({'labels': classifier.labels,
+                         'priors': [classifier.priors[label] for label in classifier.labels],
+                         'smoothing': classifier.smoothing,
+                         'max_count': classifier.max_count,
+                         'counts_type': counts_type,
+                         'width': width,
+                         'byteorder': sys.byteorder,
+                         'n_labels': n_labels,
+                         'sections': positions}).encode('utf-8')
+    header += b' ' * (-len(header) % 8)
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for name, data in sections:
+            f.write(data)
+            f.write(b'\0' * (-len(data) % 8))
+
+def load(path, classifier, mmap=True):
+    """
+    Reads the model at `path` into `classifier`, an untrained
+    NaiveBayesClassifier, and returns it. If `mmap` is True the arrays are
+    memory-mapped instead of read, and the model is only copied to memory if
+    it's trained further.
+    """
+    with open(path, 'rb') as f:
+        if mmap:
+            data = mmap_module.mmap(f.fileno(), 0, access=mmap_module.ACCESS_READ)
+        else:
+            data = f.read()
+    buffer = memoryview(data)
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise ValueError('{} is not a saved NaiveBayesClassifier model.'.format(path))
+    header_size, = struct.unpack('<Q', buffer[len(MAGIC):len(MAGIC) + 8])
+    start = len(MAGIC) + 8
+    header = json.loads(buffer[start:start + header_size].tobytes().decode('utf-8'))
+    start += header_size
+
+    def section(name, typecode=None):
+        offset, length = header['sections'][name]
+        view = buffer[start + offset:start + offset + length]
+        return view.cast(typecode) if typecode else view
+
+    classifier.priors = dict(zip(header['labels'], header['priors']))
+    classifier.labels = header['labels']
+    classifier._label_index = index_labels(classifier.labels)
+    # The stored log odds already use this smoothing.
+    classifier._smoothing = header['smoothing']
+    classifier.max_count = header['max_count']
+    if (header['width'] is None) != (getattr(classifier, 'width', None) is None):
+        raise ValueError('Use HashedNaiveBayesClassifier.load for hashed models, '
+                         'and NaiveBayesClassifier.load for the others.')
+    if header['width'] is not None:
+        classifier.width = header['width']
+        classifier.vocabulary = HashedVocabulary(classifier.width)
+        classifier.events = range(classifier.width)
+
+    if mmap and header['byteorder'] == sys.byteorder:
+        if header['width'] is None:
+            vocabulary = MappedVocabulary(section('offsets', 'Q'), section('keys'), section('table', 'q'))
+            classifier.vocabulary = vocabulary
+            classifier.events = vocabulary
+        classifier.counts = section('counts', header['counts_type'])
+        classifier.log_odds = section('log_odds', 'd')
+        return classifier
+
+    offsets = array('Q', section('offsets').tobytes())
+    counts = array(header['counts_type'], section('counts').tobytes())
+    log_odds = array('d', section('log_odds').tobytes())
+    if header['byteorder'] != sys.byteorder:
+        for values in (offsets, counts, log_odds):
+            values.byteswap()
+    if header['width'] is None:
+        keys = section('keys').tobytes()
+        classifier.events = [decode_event(keys[offsets[i]:offsets[i + 1]])
+                             for i in range(len(offsets) - 1)]
+        classifier.vocabulary = {event: i for i, event in enumerate(classifier.events)}
+    classifier.counts = counts
+    classifier.log_odds = log_odds
+    return classifier
@@ -1,9 +1,33 @@
+import os
 import sys
 
 sys.path.append('../')
 
 import unittest
-from bayesian import Bayes, classify, classify_normal
+from array import array
+from collections import Counter
+from contextlib import contextmanager
+from math import log
+from bayesian import Bayes, classify, classify_normal, NaiveBayesClassifier, GaussianClassifier
+from bayesian import HashedNaiveBayesClassifier
+from bayesian import gaussian_probability, properties_distributions
+from bayesian import gaussian_distribution, RunningGaussian, csv_records
+
+@contextmanager
+def without_numpy():
+    """ Makes the optional NumPy backend fail to import. """
+    import bayesian
+    original = sys.modules.get('bayesian.vectorized')
+    sys.modules['bayesian.vectorized'] = None
+    if original is not None:
+        del bayesian.vectorized
+    try:
+        yield
+    finally:
+        if original is None:
+            del sys.modules['bayesian.vectorized']
+        else:
+            sys.modules['bayesian.vectorized'] = bayesian.vectorized = original
 
 class TestBayes(unittest.TestCase):
     def test_empty_constructor(self):
@@ -71,6 +95,45 @@ class TestBayes(unittest.TestCase):
         self.assertEqual(Bayes([.5, .5]) * {'0': 0.9, '1': 0.1}, [0.45, 0.05])
         self.assertEqual(Bayes([.5, .5]) * [('0', 0.9), ('1', 0.1)], [0.45, 0.05])
 
+    def test_in_place_operators(self):
+        b = Bayes({'a': 5, 'b': 2})
+        same = b
+        b *= {'a': 2, 'b': 0}
+        self.assertIs(b, same)
+        self.assertEqual(list(b), [10, 0])
+        b /= (2, 0)
+        self.assertEqual(list(b), [5, 0])
+        self.assertEqual(b.labels, ['a', 'b'])
+        self.assertIs(b.normalize_(), same)
+        self.assertEqual(list(b), [1, 0])
+        self.assertEqual(list(Bayes([0, 0]).normalize_()), [0, 0])
+
+        b = Bayes({'a': 1, 'b': 1})
+        b *= [('a', 2), ('b', 3)]
+        self.assertEqual(list(b), [2, 3])
+        b *= (x for x in [2, 1])
+        self.assertEqual(list(b), [4, 3])
+        odds = [0.5, 2]
+        b /= odds
+        self.assertEqual(list(b), [8, 1.5])
+        self.assertEqual(odds, [0.5, 2])
+
+    def test_update_without_normalizing(self):
+        b = Bayes([1, 2])
+        b.update((2, 1), normalize=False)
+        self.assertEqual(list(b), [2, 2])
+        b.update((3, 1), normalize=False).normalize_()
+        self.assertEqual(list(b), [0.75, 0.25])
+
+    def test_cast_keeps_labels(self):
+        b = Bayes({'a': 1, 'b': 2})
+        for other in [b * (1, 1), b.normalized(), b.opposite(), b / [1, 1]]:
+            self.assertEqual(other.labels, ['a', 'b'])
+            self.assertIs(other._label_index, b._label_index)
+        self.assertEqual(b.opposite(), [2, 1])
+        self.assertEqual(b * (3, 1), [3, 2])
+        self.assertEqual((b * [('b', 1), ('a', 2)]).labels, ['a', 'b'])
+
     def test_equality(self):
         b1 = Bayes([0.5, 0.2, 0.3])
         b2 = Bayes([5, 2, 3])
@@ -93,6 +156,46 @@ class TestBayes(unittest.TestCase):
         b.update_from_events(['a', 'a', 'a'], {'a': (0.5, 2)})
         self.assertEqual(b, [0.5 ** 3, 2 ** 3])
 
+    def test_update_from_events_log_space(self):
+        b = Bayes([1, 1])
+        b.update_from_events(['a', 'a', 'a', 'b'], {'a': (0.5, 2)}, log_space=True)
+        self.assertAlmostEqual(b[0], 0.5 ** 3 / (0.5 ** 3 + 2 ** 3))
+        self.assertAlmostEqual(b[1], 2 ** 3 / (0.5 ** 3 + 2 ** 3))
+
+        b = Bayes({'x': 1, 'y': 1})
+        b.update_from_events(['a', 'b'], {'a': {'x': 0, 'y': 1}, 'b': {'x': 1, 'y': 1}},
+                             log_space=True)
+        self.assertEqual(b, [0, 1])
+
+    def test_update_from_events_log_space_underflow(self):
+        events_odds = {'a': (1e-200, 2e-200)}
+        b = Bayes([1e-200, 1e-200]).update_from_events(['a'], events_odds)
+        self.assertEqual(b, [0, 0])
+        b = Bayes([1e-200, 1e-200]).update_from_events(['a'], events_odds, log_space=True)
+        self.assertAlmostEqual(b[0], 1 / 3.0)
+        self.assertAlmostEqual(b[1], 2 / 3.0)
+
+    def test_log_odds(self):
+        b = Bayes([9, 1, 0])
+        self.assertEqual(b.log_odds()[2], float('-inf'))
+        for i, j in zip(Bayes.from_log_odds(b.log_odds()), [0.9, 0.1, 0]):
+            self.assertAlmostEqual(i, j)
+        self.assertEqual(Bayes.from_log_odds([float('-inf')] * 2), [0, 0])
+        self.assertEqual(Bayes.from_log_odds([-1000, -1000], ['a', 'b']).labels, ['a', 'b'])
+
+    def test_label_index(self):
+        b = Bayes({'a': 1, 'b': 2})
+        self.assertEqual(b._label_index, {'a': 0, 'b': 1})
+        b['b'] = 5
+        self.assertEqual(b[1], 5)
+        b.labels = ['x', 'y']
+        self.assertEqual(b['y'], 5)
+        self.assertEqual((b * (1, 1))['y'], 5)
+        with self.assertRaises(ValueError):
+            b['a']
+        with self.assertRaises(ValueError):
+            b.labels = ['x', 'x']
+
     def test_update_from_tests(self):
         b = Bayes([1, 1])
         b.update_from_tests([True], [0.9, 0.1])
@@ -102,6 +205,26 @@ class TestBayes(unittest.TestCase):
         b.update_from_tests([True, True, True, False], [0.5, 2])
         self.assertEqual(b, [0.5 ** 2, 2 ** 2])
 
+    def test_aggregate(self):
+        events_odds = {'a': (0.5, 2, 1), 'b': (3, 1, 0), 'c': (1, 1, 1)}
+        events = ['a'] * 300 + ['b', 'c', 'x'] * 5 + ['a']
+        expected = Bayes([1, 2, 3]).update_from_events(events, events_odds, log_space=True)
+        b = Bayes([1, 2, 3]).update_from_events(events, events_odds, aggregate=True)
+        for i, j in zip(b, expected):
+            self.assertAlmostEqual(i, j)
+        self.assertEqual(b[2], 0)
+        pruned = Bayes([1, 2, 3]).update_from_events(events, events_odds, aggregate=True,
+                                                     max_log_ratio=log(3) - log(0.5))
+        self.assertEqual(pruned.most_likely(), expected.most_likely())
+
+        tests = [True] * 20 + [False] * 3
+        for odds in ([0.5, 2], [0, 1]):
+            expected = Bayes([1, 1]).update_from_tests(tests, odds)
+            b = Bayes([1, 1]).update_from_tests(iter(tests), odds, aggregate=True)
+            for i, j in zip(b, expected.normalized()):
+                self.assertAlmostEqual(i, j)
+        self.assertEqual(Bayes([1, 3]).update_from_tests([], [0.5, 2], aggregate=True), [1, 3])
+
     def test_most_likely(self):
         b = Bayes({'a': 9, 'b': 1})
         self.assertEqual(b.most_likely(), 'a')
@@ -109,6 +232,28 @@ class TestBayes(unittest.TestCase):
         self.assertEqual(b.most_likely(0.89), 'a')
         self.assertIsNone(b.most_likely(0.91))
 
+    def test_top_k(self):
+        b = Bayes({'a': 2, 'b': 5, 'c': 3})
+        self.assertEqual(b.top_k(2), [('b', 0.5), ('c', 0.3)])
+        self.assertEqual(b.top_k(5), [('b', 0.5), ('c', 0.3), ('a', 0.2)])
+        self.assertEqual(b.top_k(0), [])
+        self.assertEqual(Bayes({'a': 1, 'b': 1}).top_k(1), [('a', 0.5)])
+        self.assertEqual(Bayes([0, 0]).top_k(1), [('0', 0)])
+
+    def test_pruned_update_from_events(self):
+        events_odds = {'a': (10, 1, 1), 'b': (1, 10, 1), 'c': (1, 1, 10)}
+        events = ['a'] * 10 + ['b', 'c', 'x']
+        b = Bayes([1, 1, 1]).update_from_events(events, events_odds, log_space=True)
+        pruned = Bayes([1, 1, 1]).update_from_events(events, events_odds, max_log_ratio=log(10))
+        self.assertEqual(pruned.most_likely(), b.most_likely())
+        self.assertEqual(list(pruned[1:]), [0, 0])
+        # Labels are not pruned while the remaining events can change the leader.
+        events = ['b', 'a', 'a']
+        b = Bayes([1, 1, 1]).update_from_events(events, events_odds, log_space=True)
+        pruned = Bayes([1, 1, 1]).update_from_events(events, events_odds, max_log_ratio=log(10))
+        self.assertEqual(b.most_likely(), '0')
+        self.assertEqual(pruned.most_likely(), '0')
+
     def test_is_likely(self):
         b = Bayes({'a': 9, 'b': 1})
         self.assertTrue(b.is_likely('a'))
@@ -157,7 +302,900 @@ class TestClassify(unittest.TestCase):
         instances = {'spam': spams, 'genuine': genuines}
         self.assertEqual(classify(message, instances), 'genuine')
 
-# Classify File and Classify Folder require too much of a test harness for now.
+class TestCompactBayes(unittest.TestCase):
+    def test_constructor(self):
+        from bayesian.compact import CompactBayes
+        b = CompactBayes({'a': 10, 'b': 50})
+        self.assertEqual(list(b), [10, 50])
+        self.assertEqual(b['b'], 50)
+        self.assertEqual(b[0], 10)
+        self.assertEqual(len(b), 2)
+        self.assertEqual(CompactBayes([1, 2]).labels, ['0', '1'])
+        self.assertEqual(CompactBayes(Bayes([('x', 1)])).labels, ('x',))
+        with self.assertRaises(ValueError):
+            b['c']
+        with self.assertRaises(AttributeError):
+            b.other = 1
+
+    def test_in_place(self):
+        from bayesian.compact import CompactBayes
+        b = CompactBayes([5, 2, 3])
+        values = b.values
+        b *= (2, 2, 1)
+        b /= (2, 2, 1)
+        self.assertIs(b.values, values)
+        self.assertEqual(list(b), [5, 2, 3])
+        self.assertEqual(b * {'0': 0, '1': 1, '2': 1}, [0, 2, 3])
+        self.assertEqual(list(b), [5, 2, 3])
+        self.assertEqual(list(b.normalize()), [0.5, 0.2, 0.3])
+
+    def test_updates(self):
+        from bayesian.compact import CompactBayes
+        b = CompactBayes({'cheating': .5, 'honest': .5})
+        b.update_from_events(['heads', 'heads', 'tails'],
+                             {'heads': {'honest': .5, 'cheating': .9},
+                              'tails': {'honest': .5, 'cheating': .1}})
+        expected = Bayes({'cheating': .5, 'honest': .5})
+        expected.update_from_events(['heads', 'heads', 'tails'],
+                                    {'heads': {'honest': .5, 'cheating': .9},
+                                     'tails': {'honest': .5, 'cheating': .1}})
+        self.assertEqual(b.to_bayes(), expected)
+        self.assertEqual(b.most_likely(), expected.most_likely())
+        self.assertEqual(b.is_likely('cheating'), expected.is_likely('cheating'))
+        self.assertIsNone(CompactBayes([0, 0]).most_likely())
+
+        b = CompactBayes({'a': 1, 'b': 1})
+        values = b.values
+        b.update([3, 1])
+        b.update(array('d', [1, 2]))
+        b.update([('a', 1), ('b', 1)])
+        self.assertIs(b.values, values)
+        self.assertEqual(list(b), [0.6, 0.4])
+        self.assertEqual(list(b.update([0, 0])), [0.0, 0.0])
+
+class TestNaiveBayesClassifier(unittest.TestCase):
+    def test_predict(self):
+        instances = {'spam': ["buy viagra", "buy cialis"] * 100 + ["meeting love"],
+                     'genuine': ["meeting tomorrow", "buy milk"] * 100}
+        classifier = NaiveBayesClassifier(instances)
+        self.assertEqual(classifier.predict('buy viagra'), 'spam')
+        self.assertEqual(classifier.predict('meeting tomorrow'), 'genuine')
+        self.assertEqual(classifier.predict('unknown words'), 'genuine')
+        self.assertIsNone(classifier.predict('unknown words', cutoff=0.6))
+
+    def test_matches_classify(self):
+        instances = {'A': ['a', 'a c'], 'B': ['b', 'b c c']}
+        classifier = NaiveBayesClassifier(instances, priors={'A': 1, 'B': 2})
+        for message in ['a', 'b', 'c', 'a b c', 'c c a']:
+            self.assertEqual(classifier.predict(message),
+                             classify(message, instances, priors={'A': 1, 'B': 2}))
+
+    def test_beliefs(self):
+        classifier = NaiveBayesClassifier({'A': ['a'], 'B': ['b']})
+        b = classifier.beliefs('a')
+        self.assertEqual(b.labels, ['A', 'B'])
+        self.assertTrue(b.is_likely('A', 0.99))
+
+    def test_pruned_predict(self):
+        import random
+        rng = random.Random(0)
+        words = ['w{}'.format(i) for i in range(200)]
+        instances = {'class{}'.format(c): [' '.join(rng.choice(words[c::20] + words) for i in range(20))
+                                           for j in range(5)]
+                     for c in range(20)}
+        classifier = NaiveBayesClassifier(instances)
+        for message in instances['class3'] + instances['class7'] + ['', 'w1 w2', 'unknown']:
+            self.assertEqual(classifier.predict(message, prune=True), classifier.predict(message))
+        top = classifier.top_k(instances['class3'][0], 3)
+        self.assertEqual(len(top), 3)
+        self.assertEqual(top[0][0], 'class3')
+        self.assertGreaterEqual(top[0][1], top[1][1])
+        self.assertEqual(classifier.top_k(instances['class3'][0], 1, prune=True), top[:1])
+
+    def test_predict_batch(self):
+        instances = {'spam': ["buy viagra", "buy cialis"] * 10 + ["meeting love"],
+                     'genuine': ["meeting tomorrow", "buy milk"] * 10,
+                     'other': ["nothing to see"]}
+        classifier = NaiveBayesClassifier(instances)
+        messages = ['buy viagra', '', 'unknown', 'meeting tomorrow to buy milk',
+                    'nothing to see here', 'love love meeting']
+        predictions, posteriors = classifier.predict_batch(messages)
+        self.assertEqual(predictions, [classifier.predict(m) for m in messages])
+        for message, row in zip(messages, posteriors):
+            for i, j in zip(row, classifier.beliefs(message)):
+                self.assertAlmostEqual(i, j)
+
+        predictions, posteriors = classifier.predict_batch(messages, cutoff=0.9)
+        self.assertEqual(predictions, [classifier.predict(m, cutoff=0.9) for m in messages])
+        self.assertEqual(classifier.predict_batch([])[0], [])
+
+    def test_predict_batch_without_numpy(self):
+        classifier = NaiveBayesClassifier({'A': ['a'], 'B': ['b']})
+        with without_numpy():
+            predictions, posteriors = classifier.predict_batch(['a', 'b b', 'c'])
+        self.assertEqual(predictions, ['A', 'B', 'A'])
+        self.assertEqual(posteriors[2], [0.5, 0.5])
+
+    def test_partial_fit(self):
+        instances = {'A': ['a b', 'a c'], 'B': ['b c', 'b d d']}
+        full = NaiveBayesClassifier(instances)
+
+        online = NaiveBayesClassifier()
+        online.partial_fit(['a b', 'b c'], ['A', 'B'])
+        online.partial_fit(['a c', 'b d d'], ['A', 'B'])
+        self.assertEqual(online.labels, ['A', 'B'])
+        self.assertEqual(online.events_counts, full.events_counts)
+        self.assertEqual(online.log_likelihoods('a b c d e'), full.log_likelihoods('a b c d e'))
+
+        online.partial_fit(['e'], ['C'])
+        self.assertEqual(online.labels, ['A', 'B', 'C'])
+        self.assertEqual(online.predict('e'), 'C')
+        self.assertEqual(online.predict('d'), 'B')
+
+    def test_priors_restrict_classes(self):
+        instances = {'spam': ['buy viagra'], 'ham': ['meeting'], 'other': ['viagra viagra']}
+        classifier = NaiveBayesClassifier(instances, priors={'spam': 1, 'ham': 1})
+        self.assertEqual(classifier.labels, ['ham', 'spam'])
+        self.assertEqual(classifier.predict('viagra'), 'spam')
+        self.assertEqual(classify('viagra', instances, priors={'spam': 1, 'ham': 1}), 'spam')
+
+    def test_save_load_surrogates(self):
+        import tempfile
+        classifier = NaiveBayesClassifier({'A': ['a \udcff'], 'B': ['b']})
+        path = os.path.join(tempfile.mkdtemp(), 'model.bin')
+        classifier.save(path)
+        for mmap in (True, False):
+            loaded = NaiveBayesClassifier.load(path, mmap=mmap)
+            self.assertEqual(loaded.count('\udcff', 'A'), 1)
+            self.assertEqual(loaded.predict('\udcff'), 'A')
+            self.assertEqual(loaded.predict('\udcfe b'), 'B')
+
+    def test_wide_counts(self):
+        import tempfile
+        classifier = NaiveBayesClassifier({'A': ['a'], 'B': ['b']})
+        self.assertEqual(classifier.counts.itemsize, 4)
+        classifier._add_counts({'a': 2 ** 32}, 'A')
+        self.assertEqual(classifier.counts.typecode, 'q')
+        self.assertEqual(classifier.count('a', 'A'), 2 ** 32 + 1)
+        self.assertEqual(classifier.count('b', 'B'), 1)
+        path = os.path.join(tempfile.mkdtemp(), 'model.bin')
+        classifier.save(path)
+        for mmap in (True, False):
+            self.assertEqual(NaiveBayesClassifier.load(path, mmap=mmap).count('a', 'A'), 2 ** 32 + 1)
+
+    def test_smoothing(self):
+        import tempfile
+        instances = {'A': ['a a a'], 'B': ['b']}
+        classifier = NaiveBayesClassifier(instances)
+        self.assertGreater(classifier.beliefs('a')['A'], 0.9999)
+        classifier.smoothing = 1.0
+        expected = Bayes(classifier.priors).update_from_events(['a'], classifier.events_odds)
+        self.assertEqual(list(classifier.beliefs('a')), list(expected.normalized()))
+        self.assertAlmostEqual(classifier.beliefs('a')['A'], 0.8)
+        self.assertEqual(classifier.max_log_ratio(), log(4.0))
+
+        other = NaiveBayesClassifier(instances, smoothing=1.0)
+        self.assertEqual(other.log_odds, classifier.log_odds)
+        path = os.path.join(tempfile.mkdtemp(), 'model.bin')
+        other.save(path)
+        self.assertEqual(list(NaiveBayesClassifier.load(path).log_odds), list(other.log_odds))
+
+    def test_gaussian_priors_restrict_classes(self):
+        instances = {'a': [{'x': 1.0}, {'x': 2.0}], 'b': [{'x': 5.0}, {'x': 5.2}]}
+        classifier = GaussianClassifier(instances, priors={'a': 1})
+        self.assertEqual(classifier.labels, ['a'])
+        self.assertEqual(classifier.predict({'x': 5.1}), 'a')
+        self.assertEqual(classify_normal({'x': 5.1}, instances, priors={'a': 1}), 'a')
+        classifier.partial_fit([{'x': 9.0}], ['c'])
+        self.assertEqual(classifier.labels, ['a', 'c'])
+
+    def test_forget(self):
+        classifier = NaiveBayesClassifier({'A': ['a b'], 'B': ['b c']})
+        classifier.partial_fit(['x y'], ['A'])
+        classifier.forget('x y', 'A')
+        self.assertEqual(classifier.events_counts,
+                         NaiveBayesClassifier({'A': ['a b'], 'B': ['b c']}).events_counts)
+        self.assertNotIn('x', classifier.events_counts)
+        self.assertEqual(classifier.predict('x'), classifier.predict(''))
+
+        with self.assertRaises(ValueError):
+            classifier.forget('a a', 'A')
+        with self.assertRaises(ValueError):
+            classifier.forget('c', 'A')
+        # Failed calls don't modify the model.
+        self.assertEqual(classifier.events_counts['a'], {'A': 1})
+
+    def test_merge(self):
+        full = NaiveBayesClassifier({'A': ['a b', 'a'], 'B': ['b c'], 'C': ['c']})
+        first = NaiveBayesClassifier({'A': ['a b'], 'B': ['b c']})
+        second = NaiveBayesClassifier({'A': ['a'], 'C': ['c']})
+        first.merge(second)
+        self.assertEqual(first.labels, full.labels)
+        self.assertEqual(first.events_counts, full.events_counts)
+        self.assertEqual(first.log_likelihoods('a b c d'), full.log_likelihoods('a b c d'))
+
+    def test_train_parallel(self):
+        from bayesian.parallel import train_parallel
+        instances = {'spam': ["buy viagra", "buy cialis"] * 50 + ["meeting love"],
+                     'genuine': ["meeting tomorrow", "buy milk"] * 50,
+                     'empty': []}
+        serial = NaiveBayesClassifier(instances)
+        parallel = train_parallel(instances, workers=2, chunk_size=7)
+        self.assertEqual(parallel.labels, serial.labels)
+        self.assertEqual(parallel.events_counts, serial.events_counts)
+        self.assertEqual(parallel.vocabulary, serial.vocabulary)
+        self.assertEqual(parallel.log_odds, serial.log_odds)
+
+        priors = {'spam': 1, 'empty': 1}
+        parallel = train_parallel(instances, priors=priors, workers=2)
+        self.assertEqual(parallel.labels, ['empty', 'spam'])
+        self.assertEqual(parallel.events_counts,
+                         NaiveBayesClassifier(instances, priors=priors).events_counts)
+
+    def test_compact_storage(self):
+        classifier = NaiveBayesClassifier({'A': ['a b'], 'B': ['b c c']})
+        self.assertEqual(classifier.events, ['a', 'b', 'c'])
+        self.assertEqual(list(classifier.counts), [1, 0, 1, 1, 0, 2])
+        self.assertEqual(classifier.count('c', 'B'), 2)
+        self.assertEqual(classifier.count('c', 'A'), 0)
+        self.assertEqual(classifier.count('d', 'A'), 0)
+
+        classifier.partial_fit(['a'], ['0'])
+        self.assertEqual(classifier.labels, ['0', 'A', 'B'])
+        self.assertEqual(list(classifier.counts), [1, 1, 0, 0, 1, 1, 0, 0, 2])
+        self.assertEqual(classifier.events_counts,
+                         {'a': {'0': 1, 'A': 1}, 'b': {'A': 1, 'B': 1}, 'c': {'B': 2}})
+
+        usage = classifier.memory_usage()
+        self.assertEqual(usage['total'], usage['vocabulary'] + usage['counts'] + usage['log_odds'])
+
+    def test_pickle(self):
+        import pickle
+        classifier = NaiveBayesClassifier({'A': ['a b'], 'B': ['b c c']})
+        copy = pickle.loads(pickle.dumps(classifier))
+        self.assertEqual(copy.events_counts, classifier.events_counts)
+        self.assertEqual(copy.predict('c'), 'B')
+
+    def test_repeated_events(self):
+        classifier = NaiveBayesClassifier({'A': ['a a b'], 'B': ['b c']})
+        message = ' '.join(['a'] * 50 + ['b'] * 20 + ['x', 'c'])
+        expected = Bayes(classifier.priors).update_from_events(
+            message.split(), classifier.events_odds, log_space=True)
+        for prune in (False, True):
+            for i, j in zip(classifier.beliefs(message, prune), expected):
+                self.assertAlmostEqual(i, j)
+
+    def test_save_load(self):
+        import tempfile
+        instances = {'spam': ["buy viagra", "buy cialis"] * 10 + ["meeting love"],
+                     'genuine': ["meeting tomorrow", "buy milk"] * 10}
+        classifier = NaiveBayesClassifier(instances, priors={'spam': 1, 'genuine': 3})
+        classifier.partial_fit(['caf\u00e9 ol\u00e9'], ['genuine'])
+        messages = ['buy viagra', 'meeting', 'unknown', 'caf\u00e9', '']
+
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'model.bin')
+        classifier.save(path)
+        for mmap in (True, False):
+            loaded = NaiveBayesClassifier.load(path, mmap=mmap)
+            self.assertEqual(loaded.labels, classifier.labels)
+            self.assertEqual(loaded.priors, classifier.priors)
+            self.assertEqual(loaded.events_counts, classifier.events_counts)
+            self.assertEqual(list(loaded.events), classifier.events)
+            for message in messages:
+                self.assertEqual(loaded.log_likelihoods(message),
+                                 classifier.log_likelihoods(message))
+            self.assertEqual(loaded.predict_batch(messages)[0],
+                             classifier.predict_batch(messages)[0])
+            self.assertEqual(loaded.memory_usage()['counts'], 4 * len(classifier.counts))
+
+            # Training a loaded model copies it to memory first.
+            loaded.partial_fit(['buy now'], ['other'])
+            self.assertEqual(loaded.count('now', 'other'), 1)
+            self.assertEqual(loaded.count('buy', 'spam'), classifier.count('buy', 'spam'))
+
+        NaiveBayesClassifier().save(path)
+        self.assertEqual(NaiveBayesClassifier.load(path).labels, [])
+
+        with self.assertRaises(TypeError):
+            NaiveBayesClassifier({'A': [1]}, extractor=lambda i: [(i, i)]).save(path)
+
+class TestHashedNaiveBayesClassifier(unittest.TestCase):
+    def setUp(self):
+        self.instances = {'spam': ["buy viagra", "buy cialis"] * 10 + ["meeting love"],
+                          'genuine': ["meeting tomorrow", "buy milk"] * 10}
+
+    def test_predict(self):
+        classifier = HashedNaiveBayesClassifier(self.instances, width=1024)
+        exact = NaiveBayesClassifier(self.instances)
+        for message in ['buy viagra', 'meeting', 'buy milk', 'unknown']:
+            self.assertEqual(classifier.predict(message), exact.predict(message))
+        self.assertEqual(classifier.predict_batch(['cialis', 'tomorrow'])[0], ['spam', 'genuine'])
+
+    def test_fixed_memory(self):
+        classifier = HashedNaiveBayesClassifier(self.instances, width=64)
+        before = classifier.memory_usage()
+        classifier.partial_fit(['word{}'.format(i) for i in range(1000)], ['spam'] * 1000)
+        self.assertEqual(classifier.memory_usage(), before)
+        self.assertEqual(len(classifier.counts), 64 * 2)
+
+    def test_events_odds(self):
+        classifier = HashedNaiveBayesClassifier(self.instances, width=1024)
+        exact = NaiveBayesClassifier(self.instances)
+        events = 'buy viagra now'.split()
+        b = Bayes(classifier.priors).update_from_events(events, classifier.events_odds)
+        expected = Bayes(exact.priors).update_from_events(events, exact.events_odds)
+        for a, b in zip(b, expected):
+            self.assertAlmostEqual(a, b)
+        self.assertNotIn('now', exact.events_odds)
+        self.assertEqual(len(exact.events_odds), len(exact.events))
+
+    def test_merge(self):
+        full = HashedNaiveBayesClassifier(self.instances, width=16)
+        merged = HashedNaiveBayesClassifier({'spam': self.instances['spam']}, width=16)
+        merged.merge(HashedNaiveBayesClassifier({'genuine': self.instances['genuine']}, width=16))
+        self.assertEqual(merged.labels, full.labels)
+        self.assertEqual(merged.counts, full.counts)
+        self.assertEqual(merged.log_odds, full.log_odds)
+        self.assertEqual(merged.max_count, full.max_count)
+
+        with self.assertRaises(ValueError):
+            merged.merge(HashedNaiveBayesClassifier(self.instances, width=8))
+        with self.assertRaises(TypeError):
+            merged.merge(NaiveBayesClassifier(self.instances))
+        with self.assertRaises(TypeError):
+            NaiveBayesClassifier(self.instances).merge(merged)
+
+    def test_collision_stats(self):
+        classifier = HashedNaiveBayesClassifier(width=256)
+        self.assertEqual(classifier.collision_stats()['occupied'], 0)
+        classifier.partial_fit(['word{}'.format(i) for i in range(100)], ['A'] * 100)
+        stats = classifier.collision_stats()
+        self.assertLessEqual(stats['occupied'], 100)
+        self.assertAlmostEqual(stats['load_factor'], stats['occupied'] / 256.0)
+        self.assertGreater(stats['estimated_events'], 80)
+        self.assertLess(stats['estimated_events'], 150)
+        self.assertGreaterEqual(stats['collision_rate'], 0)
+
+        classifier.partial_fit(['word{}'.format(i) for i in range(10000)], ['A'] * 10000)
+        self.assertIsNone(classifier.collision_stats()['estimated_events'])
+
+    def test_save_load(self):
+        import tempfile
+        classifier = HashedNaiveBayesClassifier(self.instances, width=512)
+        path = os.path.join(tempfile.mkdtemp(), 'model.bin')
+        classifier.save(path)
+        for mmap in (True, False):
+            loaded = HashedNaiveBayesClassifier.load(path, mmap=mmap)
+            self.assertEqual(loaded.width, 512)
+            self.assertEqual(list(loaded.counts), list(classifier.counts))
+            self.assertEqual(loaded.predict('buy viagra'), 'spam')
+            loaded.partial_fit(['buy now'], ['spam'])
+            self.assertEqual(loaded.count('buy', 'spam'), classifier.count('buy', 'spam') + 1)
+
+        with self.assertRaises(ValueError):
+            NaiveBayesClassifier.load(path)
+        NaiveBayesClassifier(self.instances).save(path)
+        with self.assertRaises(ValueError):
+            HashedNaiveBayesClassifier.load(path)
+
+class TestClassifyFolder(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.root = tempfile.mkdtemp()
+        self.write('spam/1', 'buy viagra now')
+        self.write('spam/2', 'buy cialis')
+        self.write('genuine/1', 'meeting tomorrow')
+        self.write('genuine/2', 'remember to buy milk')
+        os.mkdir(os.path.join(self.root, 'empty'))
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.root)
+
+    def write(self, name, contents):
+        path = os.path.join(self.root, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(contents)
+        return path
+
+    def folders(self):
+        return [os.path.join(self.root, name) for name in ('spam', 'genuine', 'empty')]
+
+    def test_train_folders(self):
+        from bayesian import train_folders
+        spam, genuine, empty = self.folders()
+        for workers in (None, 3):
+            classifier = train_folders(self.folders(), workers=workers)
+            self.assertEqual(classifier.labels, sorted([spam, genuine]))
+            self.assertEqual(classifier.count('buy', spam), 2)
+            self.assertEqual(classifier.count('buy', genuine), 1)
+
+    def test_classify_file(self):
+        from bayesian import classify_file
+        spam, genuine, empty = self.folders()
+        path = self.write('unknown', 'viagra now')
+        self.assertEqual(classify_file(path, self.folders()), spam)
+        path = self.write('unknown', 'meeting')
+        self.assertEqual(classify_file(path, self.folders()), genuine)
+
+    def test_classify_folder(self):
+        from bayesian import classify_folder
+        self.write('a', 'cheap viagra')
+        self.write('b', 'meeting about milk')
+        self.write('c', 'cheap cialis')
+        import io
+        from contextlib import redirect_stdout
+        with redirect_stdout(io.StringIO()):
+            classify_folder(self.root, workers=2)
+        spam, genuine, empty = self.folders()
+        self.assertEqual(sorted(os.listdir(spam)), ['1', '2', 'a', 'c'])
+        self.assertEqual(sorted(os.listdir(genuine)), ['1', '2', 'b'])
+        self.assertEqual(os.listdir(empty), [])
+
+    def test_classify_folder_incremental(self):
+        import io
+        import shutil
+        from contextlib import redirect_stdout
+        from bayesian import classify_folder
+        from bayesian.incremental import FolderIndex
+        index = os.path.join(self.root, '.index')
+        extracted = []
+        def extractor(contents):
+            extracted.append(contents)
+            return contents.split()
+        def run():
+            del extracted[:]
+            with redirect_stdout(io.StringIO()):
+                return classify_folder(self.root, extractor, index=index)
+
+        self.write('a', 'cheap viagra')
+        self.write('genuine/1', 'remember to buy milk')
+        self.assertEqual(run(), {'added': 4, 'removed': 0, 'unchanged': 0, 'moved': 1})
+        self.assertTrue(os.path.exists(os.path.join(self.root, 'spam', 'a')))
+        # Both genuine files have the same contents, extracted once.
+        self.assertEqual(len(extracted), 4)
+        self.assertEqual(run(), {'added': 0, 'removed': 0, 'unchanged': 5, 'moved': 0})
+        self.assertEqual(extracted, [])
+
+        # A file that can't be moved is only tried once.
+        self.write('spam/b', 'x')
+        self.write('b', 'viagra')
+        self.assertEqual(run(), {'added': 1, 'removed': 0, 'unchanged': 5, 'moved': 0})
+        self.assertEqual(extracted, ['x', 'viagra'])
+        self.assertEqual(run()['moved'], 0)
+        self.assertEqual(extracted, [])
+
+        os.rename(os.path.join(self.root, 'spam', 'a'), os.path.join(self.root, 'genuine', 'a'))
+        os.remove(os.path.join(self.root, 'spam', '2'))
+        self.assertEqual(run(), {'added': 1, 'removed': 2, 'unchanged': 4, 'moved': 0})
+        self.assertEqual(extracted, [])
+        model = FolderIndex(index).model
+        self.assertEqual(model.count('cheap', 'genuine'), 1)
+        self.assertEqual(model.count('cheap', 'spam'), 0)
+        self.assertEqual(model.count('cialis', 'spam'), 0)
+        self.assertEqual(model.count('viagra', 'spam'), 1)
+        self.assertEqual(len(os.listdir(os.path.join(index, 'counts'))), 4)
+
+        shutil.rmtree(os.path.join(self.root, 'spam'))
+        self.assertEqual(run()['removed'], 2)
+        self.assertEqual(FolderIndex(index).model.labels, ['genuine'])
+        self.assertEqual(sorted(name for name in os.listdir(index) if name != 'counts'),
+                         ['.bayesian-index', 'files.json', 'model-4.bin'])
+
+    def test_classify_folder_duplicates(self):
+        import io
+        import json
+        from contextlib import redirect_stdout
+        from bayesian.incremental import classify_folder
+        for i in range(40):
+            self.write('spam/{}'.format(i + 10), 'buy cheap viagra')
+            self.write('genuine/{}'.format(i + 10), 'meeting tomorrow')
+        index = os.path.join(self.root, '.index')
+        with redirect_stdout(io.StringIO()):
+            changes = classify_folder(self.root, index, workers=8)
+        self.assertEqual(changes['added'], 84)
+        counts = os.path.join(index, 'counts')
+        self.assertEqual(len(os.listdir(counts)), 5)
+        for name in os.listdir(counts):
+            with open(os.path.join(counts, name)) as f:
+                self.assertTrue(json.load(f))
+
+
+class TestAsyncClassifier(unittest.TestCase):
+    def setUp(self):
+        instances = {'spam': ["buy viagra", "buy cialis"] * 10 + ["meeting love"],
+                     'genuine': ["meeting tomorrow", "buy milk"] * 10}
+        self.classifier = NaiveBayesClassifier(instances)
+
+    def run_async(self, coroutine_function):
+        import asyncio
+        from bayesian.aio import AsyncClassifier
+        async def main():
+            async with AsyncClassifier(self.classifier, workers=2, max_batch=8) as service:
+                return service, await coroutine_function(service)
+        return asyncio.run(main())
+
+    def test_micro_batching(self):
+        import asyncio
+        messages = ['buy viagra', 'meeting tomorrow', 'cialis', 'milk'] * 3
+        service, results = self.run_async(
+            lambda service: asyncio.gather(*[service.classify(m) for m in messages]))
+        self.assertEqual(results, [self.classifier.predict(m) for m in messages])
+        # 12 requests with batches of at most 8.
+        self.assertEqual(service.batches, 2)
+
+        with without_numpy():
+            service, results = self.run_async(
+                lambda service: asyncio.gather(*[service.classify(m) for m in messages]))
+        self.assertEqual(results, [self.classifier.predict(m) for m in messages])
+
+    def test_beliefs(self):
+        service, b = self.run_async(lambda service: service.beliefs('buy viagra'))
+        self.assertEqual(b.labels, ['genuine', 'spam'])
+        for a, expected in zip(b, self.classifier.beliefs('buy viagra')):
+            self.assertAlmostEqual(a, expected)
+        service, label = self.run_async(lambda service: service.classify('buy', cutoff=0.9))
+        self.assertIsNone(label)
+
+    def test_classify_file(self):
+        import tempfile
+        path = os.path.join(tempfile.mkdtemp(), 'message')
+        with open(path, 'w') as f:
+            f.write('buy cialis now')
+        service, label = self.run_async(lambda service: service.classify_file(path))
+        self.assertEqual(label, 'spam')
+
+    def test_errors(self):
+        import asyncio
+        def extractor(instance):
+            raise KeyError(instance)
+        self.classifier.extractor = extractor
+        with self.assertRaises(KeyError):
+            self.run_async(lambda service: asyncio.gather(service.classify('a'), service.classify('b')))
+
+    def test_failing_instance(self):
+        import asyncio
+        def classify_all(service):
+            return asyncio.gather(*[service.classify(instance) for instance
+                                    in ['buy viagra'] * 5 + [123] + ['meeting tomorrow'] * 5],
+                                  return_exceptions=True)
+        service, labels = self.run_async(classify_all)
+        self.assertIsInstance(labels[5], TypeError)
+        self.assertEqual(labels[:5] + labels[6:], ['spam'] * 5 + ['genuine'] * 5)
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        from bayesian import server
+        instances = {'spam': ["buy viagra", "buy cialis"] * 10 + ["meeting love"],
+                     'genuine': ["meeting tomorrow", "buy milk"] * 10}
+        self.classifier = NaiveBayesClassifier(instances)
+        self.path = os.path.join(tempfile.mkdtemp(), 'model.bin')
+        self.classifier.save(self.path)
+        self.batcher = server.Batcher(server.load_model(self.path), batch_size=4, workers=2)
+        self.addCleanup(self.batcher.close)
+
+    def test_batcher(self):
+        messages = ['buy viagra', 'meeting tomorrow', 'cialis', 'milk', 'unknown'] * 4
+        results = self.batcher.classify(messages)
+        self.assertEqual([r['label'] for r in results], self.classifier.predict_batch(messages)[0])
+        self.assertAlmostEqual(sum(results[0]['probabilities'].values()), 1.0)
+        self.assertEqual(self.batcher.metrics.instances, 20)
+        self.assertGreaterEqual(self.batcher.metrics.batches, 5)
+        self.assertIn('bayesian_instances_total 20\n', self.batcher.metrics.render())
+
+    def test_failing_instance(self):
+        futures = [self.batcher.submit(instance)
+                   for instance in ['buy viagra'] * 5 + [123] + ['meeting tomorrow'] * 5]
+        for i, future in enumerate(futures):
+            if i == 5:
+                with self.assertRaises(TypeError):
+                    future.result()
+            else:
+                self.assertIn(future.result()['label'], ['spam', 'genuine'])
+        self.assertEqual((self.batcher.metrics.instances, self.batcher.metrics.errors), (10, 1))
+
+    def test_hashed_model(self):
+        from bayesian import server
+        HashedNaiveBayesClassifier({'A': ['a'], 'B': ['b']}, width=16).save(self.path)
+        self.assertIsInstance(server.load_model(self.path), HashedNaiveBayesClassifier)
+
+    def test_lines(self):
+        import io
+        import json
+        from bayesian import server
+        lines = ['"buy viagra"\n', '\n', '{"id": 7, "instance": "meeting tomorrow"}\n', 'nonsense\n']
+        output = io.StringIO()
+        server.serve_lines(self.batcher, lines, output)
+        responses = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(len(responses), 3)
+        self.assertEqual(responses[0]['label'], 'spam')
+        self.assertEqual((responses[1]['id'], responses[1]['label']), (7, 'genuine'))
+        self.assertIn('error', responses[2])
+        self.assertEqual(self.batcher.metrics.errors, 1)
+
+    def test_http(self):
+        import json
+        import threading
+        from urllib.request import urlopen, Request
+        from urllib.error import HTTPError
+        from bayesian import server
+        http_server = server.make_http_server(self.batcher, port=0)
+        threading.Thread(target=http_server.serve_forever, daemon=True).start()
+        self.addCleanup(http_server.server_close)
+        self.addCleanup(http_server.shutdown)
+        url = 'http://127.0.0.1:{}'.format(http_server.server_address[1])
+
+        def post(request):
+            data = json.dumps(request).encode('utf-8')
+            with urlopen(Request(url + '/classify', data)) as response:
+                return json.loads(response.read().decode('utf-8'))
+
+        self.assertEqual(post({'instance': 'buy viagra'})['label'], 'spam')
+        results = post({'instances': ['cialis', 'tomorrow']})['results']
+        self.assertEqual([r['label'] for r in results], ['spam', 'genuine'])
+        with self.assertRaises(HTTPError) as context:
+            post({'nothing': 1})
+        self.assertEqual(context.exception.code, 400)
+        with self.assertRaises(HTTPError) as context:
+            post({'instance': 123})
+        self.assertEqual(context.exception.code, 400)
+        with self.assertRaises(HTTPError) as context:
+            post({'instances': 'ab'})
+        self.assertEqual(context.exception.code, 400)
+        with urlopen(url + '/metrics') as response:
+            metrics = response.read()
+        self.assertIn(b'bayesian_requests_total 5\n', metrics)
+        self.assertIn(b'bayesian_errors_total 3\n', metrics)
+
+    def test_main(self):
+        import tempfile
+        from bayesian.__main__ import main
+        directory = tempfile.mkdtemp()
+        os.mkdir(os.path.join(directory, 'spam'))
+        with open(os.path.join(directory, 'spam', 'example'), 'w') as f:
+            f.write('viagra')
+        with open(os.path.join(directory, 'message'), 'w') as f:
+            f.write('viagra')
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            main([directory])
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        self.assertTrue(os.path.exists(os.path.join(directory, 'spam', 'message')))
+
+    def test_main_after_index(self):
+        import io
+        import tempfile
+        from contextlib import redirect_stdout
+        from bayesian.__main__ import main
+        directory = tempfile.mkdtemp()
+        for name, contents in [('spam/1', 'viagra'), ('genuine/1', 'meeting'), ('a', 'viagra')]:
+            os.makedirs(os.path.dirname(os.path.join(directory, name)) or directory, exist_ok=True)
+            with open(os.path.join(directory, name), 'w') as f:
+                f.write(contents)
+        with redirect_stdout(io.StringIO()):
+            main(['--index', '.idx', directory])
+            index_files = sorted(os.listdir(os.path.join(directory, '.idx')))
+            with open(os.path.join(directory, 'b'), 'w') as f:
+                f.write('meeting')
+            main([directory])
+        self.assertTrue(os.path.exists(os.path.join(directory, 'spam', 'a')))
+        self.assertTrue(os.path.exists(os.path.join(directory, 'genuine', 'b')))
+        self.assertEqual(sorted(os.listdir(os.path.join(directory, '.idx'))), index_files)
+
+class TestStats(unittest.TestCase):
+    def setUp(self):
+        self.instances = {'spam': ["buy viagra", "buy cialis"] * 10 + ["meeting love"],
+                          'genuine': ["meeting tomorrow", "buy milk"] * 10}
+
+    def test_disabled(self):
+        from bayesian import stats
+        self.assertIsNone(stats.current())
+        NaiveBayesClassifier(self.instances).predict('buy')
+        self.assertIsNone(stats.current())
+
+    def test_classifier(self):
+        from bayesian import stats
+        with stats.recording() as collected:
+            classifier = NaiveBayesClassifier(self.instances)
+            classifier.predict('buy viagra now')
+            with without_numpy():
+                classifier.predict_batch(['buy', 'unknown words'])
+            classifier.predict_batch(['buy', 'unknown words'])
+        self.assertIsNone(stats.current())
+        snapshot = collected.snapshot()
+        self.assertEqual(snapshot['calls']['extract'], 41 + 1 + 2 + 2)
+        self.assertEqual(snapshot['counters']['documents'], 46)
+        self.assertEqual(snapshot['counters']['trained_events'], 82)
+        self.assertEqual(snapshot['counters']['events'], 3 + 3 + 3)
+        self.assertEqual(snapshot['counters']['misses'], 1 + 2 + 2)
+        self.assertGreater(snapshot['seconds']['score'], 0)
+
+    def test_bayes(self):
+        from bayesian import stats
+        records = []
+        with stats.recording(hook=lambda *record: records.append(record)) as collected:
+            b = Bayes([1, 1], ['a', 'b'])
+            b.update_from_events(['x', 'y', 'x'], {'x': [2, 1]})
+            classify_normal({'height': 6}, {'male': [{'height': 6}, {'height': 5.5}],
+                                            'female': [{'height': 5}, {'height': 5.2}]})
+        counters = collected.snapshot()['counters']
+        self.assertEqual(counters['updates'], 3)
+        self.assertEqual((counters['events'], counters['misses']), (3, 1))
+        self.assertEqual(counters['densities'], 2)
+        self.assertEqual(records[0], ('lookup', 0.0, {'events': 3, 'misses': 1}))
+
+    def test_extract_stages(self):
+        import io
+        import tempfile
+        from contextlib import redirect_stdout
+        from bayesian import stats, classify_folder
+        with stats.recording() as collected:
+            Bayes.extract_events_odds({'a': ['x y', 'y'], 'b': ['z']})
+        snapshot = collected.snapshot()
+        self.assertEqual(snapshot['calls']['extract'], 1)
+        self.assertEqual(snapshot['calls']['count'], 1)
+
+        import shutil
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        for name, contents in [('a/1', 'x y'), ('b/1', 'z'), ('new', 'x')]:
+            os.makedirs(os.path.dirname(os.path.join(root, name)) or root, exist_ok=True)
+            with open(os.path.join(root, name), 'w') as f:
+                f.write(contents)
+        with stats.recording() as collected, redirect_stdout(io.StringIO()):
+            classify_folder(root)
+        self.assertEqual(collected.snapshot()['calls']['extract'], 3)
+
+class TestEvaluation(unittest.TestCase):
+    instances = {'spam': ["buy viagra", "buy cialis now", "cheap viagra", "cialis offer",
+                          "buy now", "meeting viagra"],
+                 'genuine': ["meeting tomorrow", "buy milk", "lunch tomorrow",
+                             "meeting notes", "milk and bread"]}
+
+    def test_priors_restrict_classes(self):
+        from bayesian.evaluation import cross_validate
+        instances = dict(self.instances, other=['buy viagra'] * 5)
+        report = cross_validate(instances, priors={'spam': 1, 'genuine': 1}, k=3, workers=1)
+        self.assertEqual(report.labels, ['genuine', 'spam'])
+        self.assertEqual(len(report.results), 11)
+        self.assertNotIn('other', [predicted for actual, predicted, p, f in report.results])
+
+    def test_same_as_retraining(self):
+        from bayesian.evaluation import cross_validate, assign_folds
+        report = cross_validate(self.instances, k=3, workers=1, seed=1)
+        self.assertEqual(len(report.results), 11)
+        labeled = [(class_, instance) for class_, instances in self.instances.items()
+                   for instance in instances]
+        folds = assign_folds(len(labeled), 3, seed=1)
+        self.assertEqual(sorted(Counter(folds).values()), [3, 4, 4])
+
+        for fold in range(3):
+            training = {}
+            for (class_, instance), f in zip(labeled, folds):
+                training.setdefault(class_, [])
+                if f != fold:
+                    training[class_].append(instance)
+            classifier = NaiveBayesClassifier(training)
+            expected = [(class_, classifier.predict(instance), classifier.beliefs(instance))
+                        for (class_, instance), f in zip(labeled, folds) if f == fold]
+            results = [r for r in report.results if r[3] == fold]
+            self.assertEqual(len(results), len(expected))
+            for (actual, predicted, probabilities, f), (class_, prediction, b) in zip(results, expected):
+                self.assertEqual((actual, predicted), (class_, prediction))
+                for i, j in zip(probabilities, b):
+                    self.assertAlmostEqual(i, j)
+
+    def test_parallel(self):
+        from bayesian.evaluation import cross_validate
+        serial = cross_validate(self.instances, k=4, workers=1)
+        parallel = cross_validate(self.instances, k=4, workers=2)
+        self.assertEqual([r[:2] for r in serial.results], [r[:2] for r in parallel.results])
+        self.assertEqual(len(parallel.timing['folds']), 4)
+
+    def test_metrics(self):
+        from bayesian.evaluation import Report
+        report = Report(['a', 'b'], [('a', 'a', [0.9, 0.1], 0),
+                                     ('a', 'b', [0.3, 0.7], 0),
+                                     ('b', 'b', [0.2, 0.8], 1),
+                                     ('b', None, [0.0, 0.0], 1)], {})
+        self.assertEqual(report.accuracy(), 0.5)
+        self.assertEqual(report.confusion_matrix(), {'a': {'a': 1, 'b': 1}, 'b': {'b': 1, None: 1}})
+        scores = report.precision_recall()
+        self.assertEqual(scores['a'], {'precision': 1.0, 'recall': 0.5, 'f1': 2 / 3.0, 'support': 2})
+        self.assertEqual(scores['b']['precision'], 0.5)
+        self.assertAlmostEqual(report.brier_score(), (0.02 + 0.98 + 0.08 + 1) / 4)
+        (confidence, accuracy, count), = report.reliability(bins=2)
+        self.assertAlmostEqual(confidence, 0.8)
+        self.assertEqual((accuracy, count), (2 / 3.0, 3))
+        self.assertEqual(report.summary()['confusion_matrix']['b'], {'b': 1, 'None': 1})
+
+    def test_copy(self):
+        classifier = NaiveBayesClassifier(self.instances)
+        copy = classifier.copy()
+        copy.partial_fit(['viagra'], ['genuine'])
+        copy.partial_fit(['new'], ['other'])
+        self.assertEqual(classifier.count('viagra', 'genuine'), 0)
+        self.assertNotIn('new', classifier.vocabulary)
+        self.assertEqual(classifier.labels, ['genuine', 'spam'])
+
+        import tempfile
+        path = os.path.join(tempfile.mkdtemp(), 'model.bin')
+        classifier.save(path)
+        mapped = NaiveBayesClassifier.load(path)
+        copy = mapped.copy()
+        copy.partial_fit(['new'], ['spam'])
+        self.assertEqual(copy.count('new', 'spam'), 1)
+        self.assertEqual(mapped.count('new', 'spam'), 0)
+
+class TestCompaction(unittest.TestCase):
+    instances = {'spam': ["buy viagra", "buy cialis now", "cheap viagra", "viagra offer"],
+                 'genuine': ["meeting tomorrow", "buy milk", "meeting notes now"]}
+
+    def test_prune(self):
+        from bayesian.compaction import prune
+        classifier = NaiveBayesClassifier(self.instances)
+        pruned = prune(classifier, min_count=2)
+        self.assertEqual(sorted(pruned.events), ['buy', 'meeting', 'now', 'viagra'])
+        self.assertEqual(pruned.events_counts, {event: counts for event, counts
+                                                in classifier.events_counts.items()
+                                                if event in pruned.vocabulary})
+        self.assertEqual(pruned.predict('viagra meeting meeting'), 'genuine')
+
+        # 'now' was seen as often in both classes.
+        pruned = prune(classifier, min_count=2, min_log_ratio=0.1)
+        self.assertEqual(sorted(pruned.events), ['buy', 'meeting', 'viagra'])
+        for message in ['buy now viagra', 'now meeting']:
+            for i, j in zip(pruned.beliefs(message), classifier.beliefs(message)):
+                self.assertAlmostEqual(i, j)
+
+        pruned = prune(classifier, max_vocabulary=1)
+        self.assertEqual(pruned.events, ['viagra'])
+        pruned.partial_fit(['new'], ['spam'])
+        self.assertEqual(pruned.count('new', 'spam'), 1)
+
+        with self.assertRaises(TypeError):
+            prune(HashedNaiveBayesClassifier(self.instances, width=16))
+
+    def test_quantize(self):
+        from bayesian.compaction import QuantizedClassifier
+        classifier = NaiveBayesClassifier(self.instances)
+        messages = ['buy viagra', 'meeting', 'cheap offer now', 'unknown', '']
+        for bits, places in ((8, 1), (16, 3)):
+            quantized = QuantizedClassifier(classifier, bits)
+            self.assertEqual(quantized.values.itemsize, bits // 8)
+            for message in messages:
+                self.assertEqual(quantized.predict(message), classifier.predict(message))
+                for i, j in zip(quantized.beliefs(message), classifier.beliefs(message)):
+                    self.assertAlmostEqual(i, j, places=places)
+        self.assertLess(quantized.memory_usage()['log_odds'], classifier.memory_usage()['log_odds'])
+        with self.assertRaises(ValueError):
+            QuantizedClassifier(classifier, bits=4)
+
+    def test_compare(self):
+        from bayesian.compaction import prune, QuantizedClassifier, compare
+        classifier = NaiveBayesClassifier(self.instances)
+        held_out = {'spam': ['cheap offer'], 'genuine': ['meeting', 'milk']}
+        report = compare(classifier, QuantizedClassifier(prune(classifier, min_count=2)), held_out)
+        self.assertEqual((report['original_events'], report['compacted_events']), (10, 4))
+        self.assertGreater(report['size_reduction'], 0.5)
+        self.assertEqual(report['original_bytes'],
+                         classifier.memory_usage()['total'] - classifier.memory_usage()['counts'])
+        self.assertEqual(report['log_odds_reduction'], 1 - 4 / 80.0)
+        self.assertEqual(report['original_accuracy'], 1.0)
+        self.assertAlmostEqual(report['accuracy_delta'], -1 / 3.0)
+
+        # Same events, so only quantization saves memory.
+        report = compare(classifier, QuantizedClassifier(classifier, bits=16), held_out)
+        self.assertEqual(report['log_odds_reduction'], 0.75)
+        self.assertLess(report['size_reduction'], 0.75)
+        self.assertEqual(report['accuracy_delta'], 0.0)
 
 class TestClassifyNormal(unittest.TestCase):
     def test_single(self):
@@ -188,5 +1226,322 @@ class TestClassifyNormal(unittest.TestCase):
                               {'height': 5.75, 'weight': 150, 'foot size': 9}]}
         self.assertEqual(classify_normal(instance, training), 'female')
 
+class TestGaussianClassifier(unittest.TestCase):
+    training = {'male': [{'height': 6, 'weight': 180, 'foot size': 12},
+                         {'height': 5.92, 'weight': 190, 'foot size': 11},
+                         {'height': 5.58, 'weight': 170, 'foot size': 12},
+                         {'height': 5.92, 'weight': 165, 'foot size': 10}],
+                'female': [{'height': 5, 'weight': 100, 'foot size': 6},
+                           {'height': 5.5, 'weight': 150, 'foot size': 8},
+                           {'height': 5.42, 'weight': 130, 'foot size': 7},
+                           {'height': 5.75, 'weight': 150, 'foot size': 9}]}
+
+    def test_sample(self):
+        classifier = GaussianClassifier(self.training)
+        instance = {'height': 6, 'weight': 130, 'foot size': 8}
+        self.assertEqual(classifier.predict(instance), 'female')
+        self.assertEqual(classifier.predict({'height': 6, 'weight': 185}), 'male')
+        self.assertEqual(classifier.predict({'unknown': 1}), 'female')
+        self.assertIsNone(classifier.predict({'unknown': 1}, cutoff=0.5))
+
+        # Same posteriors as `classify_normal` when no variance is degenerate.
+        b = Bayes({'male': 1, 'female': 1})
+        for property in instance:
+            distributions = properties_distributions(self.training)[property]
+            b.update({c: gaussian_probability(instance[property], d)
+                      for c, d in distributions.items()})
+        for i, j in zip(classifier.beliefs(instance), b.normalized()):
+            self.assertAlmostEqual(i, j)
+
+    def test_variance_floor(self):
+        classifier = GaussianClassifier({'A': [{'a': 100, 'b': 10}],
+                                         'B': [{'a': 50, 'b': 100}]})
+        self.assertEqual(classifier.predict({'a': 100, 'b': 0}), 'A')
+        self.assertEqual(classifier.predict({'a': 50, 'b': 100}), 'B')
+
+    def test_missing_properties(self):
+        classifier = GaussianClassifier({'A': [{'a': 1}, {'a': 2}],
+                                         'B': [{'b': 1}, {'b': 2}]})
+        self.assertEqual(classifier.predict({'a': 1.5, 'b': 100}), 'A')
+        self.assertEqual(classifier.predict({'a': 100, 'b': 1.5}), 'B')
+
+    def test_predict_batch(self):
+        classifier = GaussianClassifier(self.training)
+        instances = [{'height': 6, 'weight': 130, 'foot size': 8},
+                     {'height': 6, 'weight': 185},
+                     {},
+                     {'foot size': 11.5}]
+        predictions, posteriors = classifier.predict_batch(instances)
+        self.assertEqual(predictions, [classifier.predict(i) for i in instances])
+        for instance, row in zip(instances, posteriors):
+            for i, j in zip(row, classifier.beliefs(instance)):
+                self.assertAlmostEqual(i, j)
+
+        try:
+            import numpy
+        except ImportError:
+            pass
+        else:
+            features = [[instance.get(p, float('nan')) for p in classifier.properties]
+                        for instance in instances]
+            self.assertEqual(classifier.predict_batch(numpy.array(features))[0], predictions)
+
+        with without_numpy():
+            self.assertEqual(classifier.predict_batch(instances)[0], predictions)
+
+    def assertSameModel(self, a, b):
+        self.assertEqual(a.labels, b.labels)
+        self.assertEqual(a.properties, b.properties)
+        for rows_a, rows_b in ((a.means, b.means), (a.variances, b.variances)):
+            for row_a, row_b in zip(rows_a, rows_b):
+                for i, j in zip(row_a, row_b):
+                    self.assertAlmostEqual(i, j)
+
+    def test_running_gaussian(self):
+        values = [5, 5.5, 5.42, 5.75, 1e9 + 1, 1e9 + 2]
+        mean, variance = RunningGaussian(values).distribution()
+        expected = gaussian_distribution(values)
+        self.assertAlmostEqual(mean, expected[0])
+        self.assertAlmostEqual(variance / expected[1], 1.0)
+        self.assertEqual(RunningGaussian([3]).distribution(), (3, 0))
+
+        merged = RunningGaussian(values[:2]).merge(RunningGaussian(values[2:]))
+        self.assertEqual(merged.count, len(values))
+        self.assertAlmostEqual(merged.mean, mean)
+        self.assertAlmostEqual(merged.m2 / RunningGaussian(values).m2, 1.0)
+        self.assertEqual(RunningGaussian().merge(RunningGaussian()).count, 0)
+
+    def test_streaming(self):
+        records = iter([(class_, instance) for class_, instances in self.training.items()
+                        for instance in instances])
+        streamed = GaussianClassifier().fit_records(records)
+        self.assertSameModel(streamed, GaussianClassifier(self.training))
+
+        incremental = GaussianClassifier({'male': self.training['male'][:1]})
+        incremental.partial_fit(self.training['male'][1:], ['male'] * 3)
+        incremental.partial_fit(self.training['female'], ['female'] * 4)
+        self.assertSameModel(incremental, GaussianClassifier(self.training))
+
+    def test_merge(self):
+        shards = [GaussianClassifier({'male': self.training['male'][:2],
+                                      'female': self.training['female'][:1]}),
+                  GaussianClassifier({'male': self.training['male'][2:]}),
+                  GaussianClassifier({'female': self.training['female'][1:]})]
+        merged = shards[0].merge(shards[1]).merge(shards[2])
+        self.assertSameModel(merged, GaussianClassifier(self.training))
+
+    def test_csv_records(self):
+        import tempfile
+        path = os.path.join(tempfile.mkdtemp(), 'training.csv')
+        with open(path, 'w') as f:
+            f.write('height,gender,weight\n6,male,180\n5,female,\n')
+        self.assertEqual(list(csv_records(path, 'gender')),
+                         [('male', {'height': 6.0, 'weight': 180.0}),
+                          ('female', {'height': 5.0})])
+        self.assertEqual(list(csv_records(path, 'gender', ['weight']))[0],
+                         ('male', {'weight': 180.0}))
+
+class TestExtractor(unittest.TestCase):
+    def test_default(self):
+        from bayesian.features import Extractor
+        self.assertEqual(Extractor()('Buy  cheap, now'), ['Buy', 'cheap,', 'now'])
+
+    def test_stages(self):
+        from bayesian.features import Extractor, WORDS
+        extractor = Extractor(pattern=WORDS, lowercase=True, stop_words=['the'], ngrams=(1, 2))
+        self.assertEqual(extractor('Buy the cheap, pills!'),
+                         ['buy', 'cheap', 'pills', 'buy cheap', 'cheap pills'])
+        self.assertEqual(Extractor(ngrams=3)('a b c d'), ['a b c', 'b c d'])
+        self.assertEqual(Extractor(ngrams=2)('a'), [])
+        with self.assertRaises(ValueError):
+            Extractor(ngrams=(2, 1))
+
+    def test_hashing(self):
+        from bayesian.features import Extractor
+        events = Extractor(hashing=16)('a b c a')
+        self.assertEqual(len(events), 4)
+        self.assertEqual(events[0], events[3])
+        self.assertTrue(all(0 <= event < 16 for event in events))
+
+    def test_cache(self):
+        import pickle
+        from bayesian.features import Extractor
+        extractor = Extractor(cache_size=2)
+        self.assertEqual(extractor('a b'), ['a', 'b'])
+        events = extractor('a b')
+        self.assertEqual(events, ['a', 'b'])
+        events.append('modified')
+        self.assertEqual(extractor('a b'), ['a', 'b'])
+        self.assertEqual((extractor.hits, extractor.misses), (2, 1))
+
+        extractor('c')
+        extractor('d')
+        self.assertEqual(len(extractor._cache), 2)
+        extractor('a b')
+        self.assertEqual(extractor.misses, 4)
+
+        copy = pickle.loads(pickle.dumps(extractor))
+        self.assertEqual(copy('a b'), ['a', 'b'])
+        self.assertEqual((copy.hits, copy.misses), (0, 1))
+
+    def test_classify(self):
+        from bayesian.features import Extractor, WORDS
+        extractor = Extractor(pattern=WORDS, lowercase=True, cache_size=100)
+        instances = {'spam': ['BUY viagra!', 'buy, cialis'], 'genuine': ['Meeting tomorrow.']}
+        self.assertEqual(classify('Buy!', instances, extractor), 'spam')
+        self.assertEqual(classify('MEETING', instances, extractor), 'genuine')
+        self.assertGreater(extractor.hits, 0)
+
+class TestBenchmark(unittest.TestCase):
+    def test_run(self):
+        from bayesian.benchmark import run
+        results = run(vocabulary_size=50, document_length=5, n_classes=2,
+                      n_documents=10, n_queries=4)
+        names = [result['name'] for result in results]
+        self.assertIn('extract_events_odds', names)
+        self.assertIn('classify_folder', names)
+        for result in results:
+            self.assertGreater(result['operations'], 0)
+            self.assertLessEqual(result['p50'], result['p99'])
+            self.assertGreaterEqual(result['peak_memory'], 0)
+
+    def test_measure_setup(self):
+        import time
+        from bayesian.benchmark import measure
+        prepared = []
+        def setup(item):
+            time.sleep(0.01)
+            prepared.append(item)
+            return item * 2
+        result = measure('double', lambda item: item, [1, 2], repeat=2, setup=setup)
+        self.assertEqual(result['operations'], 4)
+        self.assertEqual(prepared, [1, 2, 1, 2, 1, 2])
+        self.assertLess(result['seconds'], 0.01)
+
+    def test_import_time(self):
+        import subprocess
+        from bayesian.benchmark import import_time
+        # Generous for slow machines, but far from what importing NumPy costs.
+        self.assertLess(import_time(repeat=3), 0.05)
+
+        heavy = ['numpy', 'asyncio', 'concurrent.futures', 'http.server', 'multiprocessing']
+        code = 'import sys, bayesian; print([m for m in {!r} if m in sys.modules])'.format(heavy)
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=root)
+        self.assertEqual(output.strip(), b'[]')
+
+class TestLazyImports(unittest.TestCase):
+    def test_lazy_names(self):
+        import bayesian
+        from bayesian.compact import CompactBayes
+        self.assertIs(bayesian.CompactBayes, CompactBayes)
+        self.assertIs(bayesian.stats, sys.modules['bayesian.stats'])
+        self.assertIn('train_parallel', dir(bayesian))
+        with self.assertRaises(AttributeError):
+            bayesian.missing
+
+    def test_backend(self):
+        import bayesian
+        classifier = NaiveBayesClassifier({'A': ['a b'], 'B': ['c']})
+        self.addCleanup(bayesian.set_backend, bayesian._backend)
+        bayesian.set_backend('python')
+        self.assertEqual(bayesian.get_backend(), 'python')
+        predictions, posteriors = classifier.predict_batch(['a', 'c'])
+        self.assertEqual(predictions, ['A', 'B'])
+        self.assertIsInstance(posteriors, list)
+
+        bayesian.set_backend('auto')
+        with without_numpy():
+            self.assertEqual(bayesian.get_backend(), 'python')
+            bayesian.set_backend('numpy')
+            with self.assertRaises(ImportError):
+                classifier.predict_batch(['a'])
+        with self.assertRaises(ValueError):
+            bayesian.set_backend('fortran')
+
+    def test_backend_environment(self):
+        import subprocess
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        code = 'import bayesian; print(bayesian._backend)'
+        run = lambda backend: subprocess.run([sys.executable, '-c', code], cwd=root,
+                                             env=dict(os.environ, BAYESIAN_BACKEND=backend),
+                                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.assertEqual(run('python').stdout.strip(), b'python')
+        failed = run('nump')
+        self.assertNotEqual(failed.returncode, 0)
+        self.assertIn(b"Unknown backend 'nump'", failed.stderr)
+
+class TestPredictionCache(unittest.TestCase):
+    instances = {'spam': ["buy viagra", "buy cialis"] * 3,
+                 'genuine': ["meeting tomorrow", "buy milk"] * 3}
+
+    def test_hits(self):
+        classifier = NaiveBayesClassifier(self.instances)
+        expected = classifier.beliefs('buy viagra viagra')
+        cache = classifier.enable_cache()
+        self.assertEqual(classifier.beliefs('buy viagra viagra'), expected)
+        # Same events in another order.
+        self.assertEqual(classifier.beliefs('viagra buy viagra'), expected)
+        classifier.beliefs('viagra buy viagra')[0] = 0
+        self.assertEqual(classifier.beliefs('viagra buy viagra'), expected)
+        self.assertEqual(classifier.predict('buy viagra viagra', prune=True), 'spam')
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (3, 2, 2))
+        self.assertEqual(classifier.predict_batch(['buy viagra', 'buy viagra'])[0], ['spam'] * 2)
+        self.assertEqual(cache.hits, 4)
+
+    def test_invalidation(self):
+        classifier = NaiveBayesClassifier(self.instances)
+        cache = classifier.enable_cache()
+        self.assertEqual(classifier.predict('buy'), 'spam')
+        classifier.partial_fit(['buy groceries'] * 3, ['genuine'] * 3)
+        self.assertEqual(classifier.predict('buy'), 'genuine')
+        self.assertEqual((cache.hits, cache.invalidations), (0, 1))
+
+        classifier.priors['spam'] = 100.0
+        self.assertEqual(classifier.predict('buy'), 'spam')
+        self.assertEqual(classifier.copy().cache, None)
+        self.assertNotEqual(classifier.copy().version, classifier.version)
+
+    def test_limits(self):
+        from bayesian.cache import PredictionCache
+        cache = PredictionCache(max_entries=2)
+        for key in [b'a', b'b', b'a', b'c']:
+            cache.put(0, key, (0.5, 0.5))
+        self.assertEqual((cache.get(0, b'b'), cache.get(0, b'a')), (None, (0.5, 0.5)))
+        self.assertEqual(cache.evictions, 1)
+
+        from bayesian.cache import features_key
+        self.assertEqual(features_key([1, 'a', 1]), features_key(['a', 1, 1]))
+        self.assertNotEqual(features_key(['a']), features_key(['a', 'a']))
+
+        cache = PredictionCache(max_bytes=1)
+        cache.put(0, b'a', (1.0,))
+        self.assertEqual((len(cache), cache.nbytes, cache.evictions), (0, 0, 1))
+
+    def test_gaussian(self):
+        import pickle
+        classifier = GaussianClassifier({'small': [{'size': 1}, {'size': 2}],
+                                         'large': [{'size': 9}, {'size': 11}]})
+        cache = classifier.enable_cache(max_entries=10)
+        self.assertEqual(classifier.predict({'size': 8}), 'large')
+        self.assertEqual(classifier.predict_batch([{'size': 8}])[0], ['large'])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        classifier.partial_fit([{'size': 8}] * 5, ['small'] * 5)
+        self.assertEqual(classifier.predict({'size': 8}), 'small')
+
+        restored = pickle.loads(pickle.dumps(classifier))
+        self.assertEqual(restored.predict({'size': 8}), 'small')
+        self.assertEqual((restored.cache.hits, restored.cache.misses), (0, 1))
+
+    def test_server_metrics(self):
+        from bayesian import server
+        classifier = NaiveBayesClassifier(self.instances)
+        classifier.enable_cache()
+        batcher = server.Batcher(classifier)
+        self.addCleanup(batcher.close)
+        batcher.classify(['buy viagra'] * 3)
+        self.assertIn('bayesian_cache_misses_total 1\n', batcher.metrics.render())
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,129 @@
+"""
+NumPy backend for scoring many instances at once. Importing this module raises
+ImportError if NumPy is not installed, in which case callers should fall back
+to the pure Python implementation in `bayesian`.
+"""
+import numpy as np
+
+class LogOddsMatrix(object):
+    """
+    (vocabulary x classes) matrix of log odds, viewing the flat `log_odds`
+    array of a `NaiveBayesClassifier` without copying it. `vocabulary` maps
+    each event to its row.
+    """
+    def __init__(self, vocabulary, log_odds, labels):
+        self.labels = list(labels)
+        self.vocabulary = vocabulary
+        n_labels = len(self.labels)
+        self.matrix = np.frombuffer(log_odds, dtype=np.float64).reshape(
+            len(log_odds) // n_labels if n_labels else 0, n_labels)
+
+    def counts(self, documents_events):
+        """
+        Converts a list of events lists into the sparse (row, column) pairs of
+        a documents x vocabulary count matrix, with rows in ascending order.
+        Unknown events are skipped.
+        """
+        vocabulary = self.vocabulary
+        rows = []
+        columns = []
+        for row, events in enumerate(documents_events):
+            for event in events:
+                column = vocabulary.get(event)
+                if column is not None:
+                    rows.append(row)
+                    columns.append(column)
+        return (np.array(rows, dtype=np.intp), np.array(columns, dtype=np.intp))
+
+    def log_scores(self, documents_events, log_priors):
+        """
+        Returns the (documents x classes) matrix of unnormalized log
+        posteriors, i.e. `log_priors` plus the product of the sparse count
+        matrix of `documents_events` with the log odds matrix.
+        """
+        n_documents = len(documents_events)
+        rows, columns = self.counts(documents_events)
+        scores = np.tile(np.asarray(log_priors, dtype=np.float64), (n_documents, 1))
+        if len(rows):
+            # Rows are sorted, so each document is a contiguous segment of
+            # `columns` and the product is a segmented sum over gathered rows.
+            starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+            scores[rows[starts]] += np.add.reduceat(self.matrix[columns], starts, axis=0)
+        return scores
+
+class GaussianMatrices(object):
+    """
+    Per-class Gaussian parameters arranged so the log densities of a whole
+    batch reduce to three matrix products. Expanding the Gaussian log density
+    gives, for each class and property with a value x:
+
+        -x**2 / (2 * var) + x * mean / var - mean**2 / (2 * var) - log(2 * pi * var) / 2
+
+    `means` and `variances` are (classes x properties) nested lists, as in
+    `GaussianClassifier`, with None for properties a class doesn't have.
+    """
+    def __init__(self, means, variances):
+        present = np.array([[mean is not None for mean in row] for row in means],
+                           dtype=bool).reshape(len(means), -1 if means else 0)
+        mean = np.array([[m if m is not None else 0.0 for m in row] for row in means],
+                        dtype=np.float64).reshape(present.shape)
+        variance = np.array([[v if v is not None else 1.0 for v in row] for row in variances],
+                            dtype=np.float64).reshape(present.shape)
+        # Classes without a property get all-zero coefficients for it.
+        self.squared = np.where(present, -0.5 / variance, 0.0).T
+        self.linear = np.where(present, mean / variance, 0.0).T
+        self.constant = np.where(present, -0.5 * mean ** 2 / variance
+                                 - 0.5 * np.log(2 * np.pi * variance), 0.0).T
+
+    def log_scores(self, features, log_priors):
+        """
+        Returns the (instances x classes) matrix of unnormalized log
+        posteriors for the 2D array `features`, where NaN marks missing
+        values.
+        """
+        features = np.asarray(features, dtype=np.float64)
+        known = ~np.isnan(features)
+        values = np.where(known, features, 0.0)
+        return (np.asarray(log_priors, dtype=np.float64)
+                + (values ** 2).dot(self.squared)
+                + values.dot(self.linear)
+                + known.astype(np.float64).dot(self.constant))
+
+def feature_matrix(instances, property_index):
+    """
+    Converts a list of {property: value} dicts into a 2D array with columns
+    ordered by `property_index` ({property: column}) and NaN for missing
+    values. Unknown properties are ignored.
+    """
+    features = np.full((len(instances), len(property_index)), np.nan)
+    for row, instance in enumerate(instances):
+        for property, value in instance.items():
+            column = property_index.get(property)
+            if column is not None:
+                features[row, column] = value
+    return features
+
+def normalize_log_scores(scores):
+    """
+    Exponentiates and normalizes each row of `scores`, returning the matrix of
+    posterior probabilities. Rows where every class is impossible become all
+    zeros.
+    """
+    top = scores.max(axis=1, initial=-np.inf, keepdims=True)
+    possible = np.isfinite(top)
+    with np.errstate(invalid='ignore'):
+        probabilities = np.where(possible, np.exp(scores - np.where(possible, top, 0)), 0.0)
+    totals = probabilities.sum(axis=1, keepdims=True)
+    return probabilities / np.where(totals == 0, 1, totals)
+
+def most_likely(labels, probabilities, cutoff=0.0):
+    """
+    Returns the most likely label for each row of `probabilities`, or None
+    where its probability is not over `cutoff`.
+    """
+    if not len(labels):
+        return [None] * len(probabilities)
+    best = probabilities.argmax(axis=1)
+    best_values = probabilities[np.arange(len(best)), best]
+    return [labels[i] if value > cutoff else None
+            for i, value in zip(best.tolist(), best_values.tolist())]